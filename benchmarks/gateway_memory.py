@@ -0,0 +1,195 @@
+"""Measures the memory held by discord.py's gateway cache with and without low memory mode.
+
+Usage::
+
+    python3.6 -m benchmarks.gateway_memory [guilds] [messages]
+
+Feeds synthetic READY, GUILD_CREATE, GUILD_MEMBERS_CHUNK and MESSAGE_CREATE
+payloads through discord.py's ``ConnectionState``, the way the gateway sends
+them to a bot on startup, and measures what's left allocated with
+tracemalloc. Every tenth guild is large: the gateway only sends its online
+members, and the offline ones come in member chunks if the client asks for
+them. The other guilds come with all of their members.
+"""
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from discord.state import ConnectionState
+
+from bot import LOW_MEMORY_OPTIONS
+
+LARGE_GUILD_MEMBERS = 5000
+SMALL_GUILD_MEMBERS = 100
+ONLINE_RATIO = 0.2
+CHANNELS_PER_GUILD = 10
+CHUNK_SIZE = 1000
+JOINED_AT = '2017-08-01T12:00:00.000000+00:00'
+
+
+def user(user_id):
+    return {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': f'{user_id % 10000:04}', 'avatar': None}
+
+
+def member(user_id):
+    return {'user': user(user_id), 'roles': [], 'joined_at': JOINED_AT, 'nick': None, 'deaf': False, 'mute': False}
+
+
+def presence(user_id):
+    return {
+        'user': {'id': str(user_id)},
+        'status': 'online',
+        'game': {'name': 'a game', 'type': 0},
+        'activities': [{'name': 'a game', 'type': 0}],
+    }
+
+
+def channel(channel_id, guild_id, position):
+    return {
+        'id': str(channel_id),
+        'guild_id': str(guild_id),
+        'type': 0,
+        'name': f'channel{position}',
+        'position': position,
+        'topic': None,
+        'nsfw': False,
+        'last_message_id': None,
+        'parent_id': None,
+        'permission_overwrites': [],
+    }
+
+
+class Guild:
+    """The gateway payloads of a synthetic guild"""
+
+    def __init__(self, index):
+        self.id = 10 ** 12 + index
+        self.large = index % 10 == 0
+        self.member_count = LARGE_GUILD_MEMBERS if self.large else SMALL_GUILD_MEMBERS
+        first_user_id = 10 ** 13 + index * LARGE_GUILD_MEMBERS
+        self.user_ids = range(first_user_id, first_user_id + self.member_count)
+        self.online = int(self.member_count * ONLINE_RATIO)
+        self.channel_ids = [self.id * 100 + i for i in range(CHANNELS_PER_GUILD)]
+
+    def guild_create(self):
+        online = self.user_ids[:self.online]
+        return {
+            'id': str(self.id),
+            'name': f'guild{self.id}',
+            'icon': None,
+            'splash': None,
+            'owner_id': str(self.user_ids[0]),
+            'region': 'us-east',
+            'afk_channel_id': None,
+            'afk_timeout': 300,
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'explicit_content_filter': 0,
+            'roles': [{'id': str(self.id), 'name': '@everyone', 'permissions': 104324161, 'position': 0,
+                       'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'emojis': [],
+            'features': [],
+            'mfa_level': 0,
+            'joined_at': JOINED_AT,
+            'large': self.large,
+            'unavailable': False,
+            'member_count': self.member_count,
+            'voice_states': [],
+            'members': [member(user_id) for user_id in (online if self.large else self.user_ids)],
+            'presences': [presence(user_id) for user_id in online],
+            'channels': [channel(channel_id, self.id, i) for i, channel_id in enumerate(self.channel_ids)],
+        }
+
+    def member_chunks(self):
+        offline = self.user_ids[self.online:]
+        for i in range(0, len(offline), CHUNK_SIZE):
+            yield {'guild_id': str(self.id), 'members': [member(user_id) for user_id in offline[i:i + CHUNK_SIZE]]}
+
+    def message_create(self, message_id):
+        return {
+            'id': str(message_id),
+            'channel_id': str(self.channel_ids[message_id % CHANNELS_PER_GUILD]),
+            'guild_id': str(self.id),
+            'author': user(self.user_ids[message_id % self.online]),
+            'member': {'roles': [], 'joined_at': JOINED_AT, 'nick': None, 'deaf': False, 'mute': False},
+            'content': 'Hello there! ' * 5,
+            'timestamp': JOINED_AT,
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+        }
+
+
+def connect(loop, guilds, messages, options):
+    """Returns the state after the bot's startup and ``messages`` messages"""
+    state = ConnectionState(
+        dispatch=lambda *args: None,
+        chunker=None,
+        handlers={},
+        syncer=None,
+        http=None,
+        loop=loop,
+        **options,
+    )
+    state.is_bot = True
+    state.parse_ready({
+        'user': user(1),
+        'guilds': [{'id': str(guild.id), 'unavailable': True} for guild in guilds],
+        'private_channels': [],
+    })
+    # the bot isn't connected, so the offline members are fed below instead
+    state._ready_task.cancel()
+    loop.run_until_complete(asyncio.wait([state._ready_task], loop=loop))
+
+    for guild in guilds:
+        state.parse_guild_create(guild.guild_create())
+    # what the requests for offline members sent when the bot is ready bring in
+    if state._fetch_offline:
+        for guild in guilds:
+            if guild.large:
+                for chunk in guild.member_chunks():
+                    state.parse_guild_members_chunk(chunk)
+
+    for i in range(messages):
+        state.parse_message_create(guilds[i % len(guilds)].message_create(10 ** 17 + i))
+    return state
+
+
+def measure(loop, guilds, messages, options):
+    gc.collect()
+    tracemalloc.start()
+    state = connect(loop, guilds, messages, options)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    members = sum(len(guild._members) for guild in state.guilds)
+    return size, members, len(state._messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3.6 -m benchmarks.gateway_memory',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('guilds', type=int, nargs='?', default=200)
+    parser.add_argument('messages', type=int, nargs='?', default=5000)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    guilds = [Guild(i) for i in range(args.guilds)]
+    members = sum(guild.member_count for guild in guilds)
+    print(f'{args.guilds} guilds with {members} memberships, {args.messages} messages')
+    for name, options in (('default', {}), ('low memory', LOW_MEMORY_OPTIONS)):
+        size, members, messages = measure(loop, guilds, args.messages, options)
+        print(f'{name:>10}: {size / 2 ** 20:6.1f} MiB, {members} cached members, {messages} cached messages')
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Measures the bot's startup phases on the default asyncio event loop and on uvloop.
+
+Usage::
+
+    python3.6 -m benchmarks.startup [repeat]
+
+Every run starts a new interpreter that imports the bot and runs
+:func:`bot.start`, the same startup phases that ``python3.6 -m bot`` goes
+through before logging in: importing, creating the event loop, connecting to
+the database and loading the extensions. The database is an in-memory SQLite
+one unless ``SNB_SQLITE`` or ``SNB_DB_HOST`` say otherwise. Each phase is the
+best of ``repeat`` runs.
+
+Logging in and receiving the guilds from the gateway need a real token, so the
+bot logs the full time to ready with every phase once it's ready instead.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def run_phases():
+    """Runs the startup phases in this interpreter and prints how long they took"""
+    started = time.perf_counter()
+    import bot
+    imported = time.perf_counter() - started
+
+    snb = bot.start()
+    snb.loop.run_until_complete(snb.logout())
+    snb.loop.close()
+    print(json.dumps(dict([('import', imported)], **snb.startup)))
+
+
+def measure(uvloop: bool):
+    env = dict(os.environ, SNB_UVLOOP='1' if uvloop else '0')
+    if 'SNB_SQLITE' not in env and 'SNB_DB_HOST' not in env:
+        env['SNB_SQLITE'] = ':memory:'
+    for token in ('TOKEN_DISCORD', 'TOKEN_TWITCH', 'TOKEN_PICARTO'):
+        env.setdefault(token, 'benchmark')
+    result = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--phases'], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode:
+        sys.exit(result.stderr.decode())
+    return json.loads(result.stdout.decode().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3.6 -m benchmarks.startup', description=__doc__.splitlines()[0])
+    parser.add_argument('repeat', type=int, nargs='?', default=5)
+    parser.add_argument('--phases', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phases:
+        return run_phases()
+
+    loops = [('asyncio', False)]
+    try:
+        importlib.import_module('uvloop')
+    except ImportError:
+        print('uvloop: not installed')
+    else:
+        loops.append(('uvloop', True))
+
+    for name, uvloop in loops:
+        runs = [measure(uvloop) for _ in range(args.repeat)]
+        phases = {phase: min(run[phase] for run in runs) for phase in runs[0]}
+        total = min(sum(run.values()) for run in runs)
+        details = ', '.join(f'{phase} {seconds * 1000:.0f}ms' for phase, seconds in phases.items())
+        print(f'{name:>7}: {total * 1000:.0f}ms until logging in ({details})')
+
+
+if __name__ == '__main__':
+    main()
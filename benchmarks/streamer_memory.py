@@ -0,0 +1,125 @@
+"""Measures the memory held by tracked and live Twitch streamers.
+
+Usage::
+
+    python3.6 -m benchmarks.streamer_memory [count]
+
+Compares the slotted streamers, which only keep the fields that polling and
+the notifications need, with the baseline streamers, which had a ``__dict__``
+and kept the whole API response. Tracked streamers are :class:`TrackedStreamer`
+records, live ones are :class:`TwitchStreamer` instances. Allocations are measured with tracemalloc after
+the API responses themselves have been dropped, as they are after a poll.
+"""
+
+import argparse
+import copy
+import gc
+import tracemalloc
+
+from bot.cogs.services.service import TrackedStreamer
+from bot.cogs.services.twitch import TwitchStreamer, _get_service_id
+
+# A stream from a /streams response of the Twitch v5 API
+STREAM = {
+    '_id': 23932774784,
+    'game': 'BATMAN - The Telltale Series',
+    'viewers': 7254,
+    'video_height': 720,
+    'average_fps': 60,
+    'delay': 0,
+    'created_at': '2016-12-14T22:49:56Z',
+    'is_playlist': False,
+    'stream_type': 'live',
+    'preview': {
+        'small': 'https://static-cdn.jtvnw.net/previews-ttv/live_user_dansgaming-80x45.jpg',
+        'medium': 'https://static-cdn.jtvnw.net/previews-ttv/live_user_dansgaming-320x180.jpg',
+        'large': 'https://static-cdn.jtvnw.net/previews-ttv/live_user_dansgaming-640x360.jpg',
+        'template': 'https://static-cdn.jtvnw.net/previews-ttv/live_user_dansgaming-{width}x{height}.jpg',
+    },
+    'channel': {
+        'mature': False,
+        'partner': True,
+        'status': 'I am Batman - Serious Batman Time',
+        'broadcaster_language': 'en',
+        'display_name': 'DansGaming',
+        'game': 'BATMAN - The Telltale Series',
+        'language': 'en',
+        '_id': 7236692,
+        'name': 'dansgaming',
+        'created_at': '2009-07-15T03:02:41Z',
+        'updated_at': '2016-12-15T01:33:58Z',
+        'logo': 'https://static-cdn.jtvnw.net/jtv_user_pictures/dansgaming-profile_image-76e4a4ab9388bc9c-300x300.png',
+        'video_banner': 'https://static-cdn.jtvnw.net/jtv_user_pictures/dansgaming-channel_offline_image.png',
+        'profile_banner': 'https://static-cdn.jtvnw.net/jtv_user_pictures/dansgaming-profile_banner.png',
+        'profile_banner_background_color': None,
+        'url': 'https://www.twitch.tv/dansgaming',
+        'views': 63906830,
+        'followers': 538598,
+    },
+}
+
+
+class BaselineTwitchStreamer:
+    """The streamer before it used ``__slots__``, keeping the whole API response"""
+
+    def __init__(self, *, db_id, service_id, channel_name):
+        self.db_id = db_id
+        self.service_id = service_id
+        self.channel_name = channel_name
+        self.api = None
+
+    @classmethod
+    def from_api_response(cls, api, database):
+        service_id = _get_service_id(api)
+        database_streamer = database.get(service_id, None)
+        streamer = cls(
+            db_id=database_streamer.db_id if database_streamer else None,
+            service_id=service_id,
+            channel_name=api.get('display_name', None) or api['channel']['display_name'],
+        )
+        streamer.api = api
+        return service_id, streamer
+
+
+def responses(count):
+    for i in range(count):
+        api = copy.deepcopy(STREAM)
+        api['_id'] += i
+        api['channel']['_id'] += i
+        api['channel']['display_name'] = f'streamer{i}'
+        yield api
+
+
+def measure(create):
+    """Returns the bytes still allocated by what ``create`` returns"""
+    gc.collect()
+    tracemalloc.start()
+    kept = create()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3.6 -m benchmarks.streamer_memory',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('count', type=int, nargs='?', default=100000)
+    args = parser.parse_args()
+
+    streamers = (
+        ('baseline', BaselineTwitchStreamer, BaselineTwitchStreamer),
+        ('slotted', TrackedStreamer, TwitchStreamer),
+    )
+    for name, tracked_cls, live_cls in streamers:
+        tracked = measure(lambda: [
+            tracked_cls(db_id=i, service_id=str(i), channel_name=f'streamer{i}') for i in range(args.count)
+        ])
+        live = measure(lambda: dict(live_cls.from_api_response(api, {}) for api in responses(args.count)))
+        print(f'{name:>8}: {tracked / args.count:7.0f} bytes per tracked streamer, '
+              f'{live / args.count:7.0f} bytes per live streamer')
+
+
+if __name__ == '__main__':
+    main()
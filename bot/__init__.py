@@ -2,17 +2,27 @@ import asyncio
 import datetime
 import logging
 import os
+import time
 import traceback
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueListener, TimedRotatingFileHandler
 
 import aiohttp
 import discord
 from discord.ext import commands
 
-from .utils import Database, strings, errors
+from .utils import Database, LiveUpdater, OutboundScheduler, StreamHistory, Templates, ThumbnailVersions, \
+    Tracer, Webhooks, async_cache, strings, errors, outbound
+from .utils.logs import DroppingQueueHandler, JsonFormatter
 
 
 def setup_logging():
+    """Sets up logging without blocking the event loop.
+
+    Records are put in a bounded queue, and written to the terminal and to a
+    JSON lines file by a background thread. Records are dropped if the queue is
+    full, instead of blocking.
+    """
+
     dt_fmt = '%Y-%m-%d %H:%M:%S'
     formatter = logging.Formatter('[{asctime}] [{levelname:<7}] {name}: {message}', dt_fmt, style='{')
 
@@ -23,21 +33,50 @@ def setup_logging():
         backupCount=3,
         utc=True,
     )
-    rotating_handler.setFormatter(formatter)
+    rotating_handler.setFormatter(JsonFormatter())
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
 
+    queue_handler = DroppingQueueHandler()
+    listener = QueueListener(queue_handler.queue, rotating_handler, stream_handler)
+    listener.start()
+
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
 
-    logger.addHandler(rotating_handler)
-    logger.addHandler(stream_handler)
+    logger.addHandler(queue_handler)
+
+    return logger, listener
+
+
+def shutdown_logging():
+    """Writes the pending log records and closes the log handlers"""
+    log_listener.stop()
+    for hdlr in log_listener.handlers:
+        hdlr.close()
+    for hdlr in log.handlers[:]:
+        hdlr.close()
+        log.removeHandler(hdlr)
+
 
-    return logger
+log, log_listener = setup_logging()
 
 
-log = setup_logging()
+def setup_event_loop():
+    """Installs the uvloop event loop policy if uvloop is available.
+
+    Setting ``SNB_UVLOOP=0`` forces the default asyncio event loop.
+    """
+
+    if os.environ.get('SNB_UVLOOP', '1') == '0':
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
 
 
 def get_prefix(bot, msg):
@@ -64,27 +103,62 @@ def get_prefix(bot, msg):
     return prefix
 
 
+class Context(commands.Context):
+    """Context whose replies go through the interactive lane of the outbound scheduler"""
+
+    async def send(self, *args, **kwargs):
+        await self.bot.outbound.acquire(outbound.INTERACTIVE)
+        return await super().send(*args, **kwargs)
+
+
 class StreamNotificationBot(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.version = '2.2.0'
         self.uptime = datetime.datetime.utcnow()
+        self.low_memory = kwargs.get('low_memory', False)
+        # how many delivery workers send the notifications, if the bot doesn't
+        self.delivery_workers = kwargs.get('delivery_workers', 0)
         self.database = kwargs['database']
         self.session = aiohttp.ClientSession(loop=self.loop)
+        self.outbound = OutboundScheduler(rate=outbound.shared_rate(self.delivery_workers + 1))
+        self.webhooks = Webhooks(self)
+        self.templates = Templates(self)
+        self.thumbnails = ThumbnailVersions()
+        self.history = StreamHistory(loop=self.loop, database=self.database)
+        self.live_updates = LiveUpdater(bot=self)
+        self.tracer = Tracer(loop=self.loop)
+        # when startup began, which start() sets, and how long each phase took in seconds
+        self.started = time.perf_counter()
+        self.startup = {}
+        self.ready_after = None
         self.initial_extensions = [
             'bot.cogs.services',
             'bot.cogs.admin',
             'bot.cogs.meta',
         ]
 
+        extensions_started = time.perf_counter()
         for extension in self.initial_extensions:
             try:
                 self.load_extension(extension)
             except Exception as e:  # noqa
                 print(f'Failed to load extension {extension}\n{type(e).__name__}: {e}')
+        self.startup['extensions'] = time.perf_counter() - extensions_started
+
+    async def get_context(self, message, *, cls=Context):
+        return await super().get_context(message, cls=cls)
+
+    @async_cache(size=512)
+    async def get_user_info_cached(self, user_id: int):
+        """Fetches a user over REST, for when they aren't in the gateway cache"""
+        return await self.get_user_info(user_id)
 
     async def logout(self):
         log.info('Logging out...')
+        self.live_updates.close()
+        await self.history.close()
+        await self.tracer.export()
         await self.database.close()
         await self.session.close()
         await super().logout()
@@ -95,6 +169,12 @@ class StreamNotificationBot(commands.Bot):
         print(self.user.id)
         print('------')
 
+        if self.ready_after is None:
+            self.ready_after = time.perf_counter() - self.started
+            self.startup['login and gateway'] = self.ready_after - sum(self.startup.values())
+            phases = ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in self.startup.items())
+            log.info('Ready %.2fs after startup (%s)', self.ready_after, phases)
+
         await self.change_presence(game=discord.Game(name='snb?help'))
 
     async def on_command_error(self, ctx, error):
@@ -119,29 +199,93 @@ class StreamNotificationBot(commands.Bot):
         log.info('%s in %s: %s', ctx.message.author.name, destination, ctx.message.content)
 
 
-def main():
-    loop = asyncio.get_event_loop()
-    database = loop.run_until_complete(Database.create_database(
+async def create_database(loop):
+    """Creates the storage backend.
+
+    If ``SNB_SQLITE`` is set, the bot uses a SQLite database at that path
+    (``:memory:`` for an in-memory one), otherwise it connects to Postgres at
+    ``SNB_DB_HOST`` and ``SNB_DB_PORT``. Read-only queries go to a replica if
+    ``SNB_DB_REPLICA_HOST`` and ``SNB_DB_REPLICA_PORT`` are set.
+    """
+
+    sqlite_path = os.environ.get('SNB_SQLITE')
+    if sqlite_path:
+        from .utils.sqlite import SQLiteDatabase
+        return await SQLiteDatabase.create_database(loop=loop, path=sqlite_path)
+
+    return await Database.create_database(
         loop=loop,
         username='snb_role',
         password='snb_role',
         database='snb_db',
-    ))
+        hostname=os.environ.get('SNB_DB_HOST', 'localhost'),
+        port=int(os.environ.get('SNB_DB_PORT', 5432)),
+        replica_hostname=os.environ.get('SNB_DB_REPLICA_HOST'),
+        replica_port=int(os.environ.get('SNB_DB_REPLICA_PORT', 5432)),
+    )
+
+
+# Offline members of large guilds aren't requested, and few messages are cached
+LOW_MEMORY_OPTIONS = dict(
+    low_memory=True,
+    fetch_offline_members=False,
+    max_messages=100,
+)
+
+
+def low_memory_options():
+    """Client options that trim the gateway caches down to what the bot needs.
+
+    Enabled with ``SNB_LOW_MEMORY=1``. Users that aren't cached are fetched
+    over REST when they're needed instead. Presences and the online members
+    of large guilds are still cached, since discord.py has no option to stop
+    receiving them.
+    """
+
+    if os.environ.get('SNB_LOW_MEMORY', '0') == '0':
+        return {}
 
-    snb = StreamNotificationBot(
+    return dict(LOW_MEMORY_OPTIONS)
+
+
+def create_bot(loop, database):
+    """Creates the bot and loads its extensions"""
+    return StreamNotificationBot(
         command_prefix=get_prefix,
         description=strings.bot_description,
         help_attrs=dict(hidden=True),
         loop=loop,
         database=database,
+        delivery_workers=int(os.environ.get('SNB_DELIVERY_WORKERS', 0)),
+        **low_memory_options(),
     )
 
-    snb.run(os.environ['TOKEN_DISCORD'])
 
-    handlers = log.handlers[:]
-    for hdlr in handlers:
-        hdlr.close()
-        log.removeHandler(hdlr)
+def start():
+    """Runs the startup phases that come before logging in.
 
+    :return: The bot, with how long each phase took in its ``startup``
+    """
+    started = time.perf_counter()
+    if setup_event_loop():
+        log.info('Using uvloop event loop')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    event_loop_ready = time.perf_counter()
+    database = loop.run_until_complete(create_database(loop))
+    database_ready = time.perf_counter()
+
+    snb = create_bot(loop, database)
+    snb.started = started
+    snb.startup = dict([
+        ('event loop', event_loop_ready - started),
+        ('database', database_ready - event_loop_ready),
+    ], **snb.startup)
+    return snb
+
+
+def main():
+    snb = start()
+    snb.run(os.environ['TOKEN_DISCORD'])
 
-main()
+    shutdown_logging()
@@ -0,0 +1,39 @@
+"""Exports or imports the subscription database.
+
+Usage::
+
+    python3.6 -m bot.backup export backup.snbx
+    python3.6 -m bot.backup import backup.snbx
+"""
+
+import argparse
+import asyncio
+
+from . import create_database, shutdown_logging
+from .utils.backup import export_database, import_database
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3.6 -m bot.backup', description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    database = loop.run_until_complete(create_database(loop))
+
+    action = export_database if args.action == 'export' else import_database
+    try:
+        if not hasattr(database, 'pool'):
+            parser.error('backups need the Postgres database')
+        pool = database.read_pool if args.action == 'export' else database.pool
+        progress = loop.run_until_complete(action(pool, args.path, loop=loop))
+        print(f'{args.action.capitalize()} finished: {progress}')
+    finally:
+        loop.run_until_complete(database.close())
+        shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
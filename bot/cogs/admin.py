@@ -1,8 +1,12 @@
+import datetime
 import logging
+import pathlib
 
 import discord
 from discord.ext import commands
 
+from ..utils.backup import export_database, import_database
+
 log = logging.getLogger(__name__)
 
 
@@ -26,6 +30,95 @@ class Admin:
 
         await self.bot.change_presence(game=discord.Game(name=status))
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def thumbnails(self, ctx):
+        """Show how often the notifications reuse a thumbnail URL."""
+
+        await ctx.send(f'```{self.bot.thumbnails.stats()}```')
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def breakers(self, ctx):
+        """Show the circuit breaker state of every service."""
+
+        states = '\n'.join(
+            f'{name}: {cog.poller.breaker}'
+            for name, cog in self.bot.cogs.items()
+            if hasattr(cog, 'poller')
+        )
+        await ctx.send(f'```{states}```')
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def polling(self, ctx, service: str = None, plan: str = None):
+        """Show how each service is polled, or force a service's polling plan.
+
+        Without a plan, only shows how the service is polled. The plan can be
+        one of batch, listing or auto.
+        """
+
+        if service:
+            cog = self.bot.get_cog(service.capitalize())
+            if not hasattr(cog, 'poller'):
+                return await ctx.send(f'Unknown service: {service}')
+            if plan is not None:
+                if plan not in cog.poller.PLANS + ('auto',):
+                    return await ctx.send(f'Unknown plan: {plan}')
+                if plan != 'auto' and not cog.poller.supports(plan):
+                    return await ctx.send(f"{service.capitalize()} doesn't support the {plan} plan.")
+                cog.poller.forced_plan = None if plan == 'auto' else plan
+
+        lines = []
+        for name, cog in self.bot.cogs.items():
+            if not hasattr(cog, 'poller'):
+                continue
+            if service and name != service.capitalize():
+                continue
+            poller = cog.poller
+            lines.append(f'{name}: last plan {poller.last_plan}, forced plan {poller.forced_plan}')
+            for plan_name in poller.PLANS:
+                lines.append(f'  {plan_name}: {poller.plan_stats[plan_name]}')
+        await ctx.send('```{}```'.format('\n'.join(lines)))
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def latency(self, ctx):
+        """Show the notification latency of every stage and export the latest traces."""
+
+        path = await self.bot.tracer.export()
+        await ctx.send(f'```{self.bot.tracer.summary()}```\nTraces exported to `{path}`')
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def export(self, ctx):
+        """Export the subscription database into the backups directory."""
+
+        if not hasattr(self.bot.database, 'pool'):
+            return await ctx.send('Exporting needs the Postgres database.')
+        path = pathlib.Path('backups')
+        path.mkdir(exist_ok=True)
+        path /= datetime.datetime.utcnow().strftime('snb-%Y%m%d-%H%M%S.snbx')
+        async with ctx.typing():
+            progress = await export_database(self.bot.database.read_pool, path, loop=self.bot.loop)
+        await ctx.send(f'Exported to `{path}`: {progress}')
+
+    @commands.command(name='import', hidden=True)
+    @commands.is_owner()
+    async def _import(self, ctx, *, path: str):
+        """Import a subscription database export, skipping existing subscriptions."""
+
+        if not hasattr(self.bot.database, 'pool'):
+            return await ctx.send('Importing needs the Postgres database.')
+        async with ctx.typing():
+            progress = await import_database(self.bot.database.pool, path, loop=self.bot.loop)
+        await ctx.send(f'Imported `{path}`: {progress}')
+
+    @_import.error
+    @export.error
+    async def backup_error(self, ctx: commands.Context, error):
+        await ctx.send(f'Failed to execute command!\n{type(error).__name__}: {error}')
+
     @commands.command(name='reload', hidden=True)
     @commands.is_owner()
     async def _reload(self, ctx, *, ext: str = None):
@@ -1,18 +1,172 @@
+import asyncio
 import datetime
 import logging
 import os
+from collections import Counter
 
 import discord.utils
 from discord.ext import commands
 
+from .services.service import validate_notification_channel
+from ..utils import errors, outbound
+from ..utils.templates import validate_role_mentions
+
 log = logging.getLogger(__name__)
 
 
+def _is_online(member):
+    return member.status != discord.Status.offline
+
+
+def _is_text(channel):
+    return not isinstance(channel, discord.VoiceChannel)
+
+
+def _git_revision():
+    cmd = r'git show -s HEAD~3..HEAD --format="[{}](https://github.com/ivandardi/StreamNotificationBot/commit/%H) %s (%cr)"'
+    if os.name == 'posix':
+        cmd = cmd.format(r'\`%h\`')
+    else:
+        cmd = cmd.format(r'`%h`')
+
+    return os.popen(cmd).read().strip()
+
+
+class Statistics:
+    """Member and channel counters kept up to date from gateway events.
+
+    Every membership is counted once per guild in ``memberships`` and
+    ``online``, while ``unique_members`` and ``unique_online`` map a user id
+    to how many of their memberships are counted, so that the unique totals
+    are simply the length of those counters.
+
+    In low memory mode members aren't cached, so only ``memberships`` and
+    ``text_channels`` are kept, from the guilds' member counts.
+    """
+
+    def __init__(self, low_memory=False):
+        self.low_memory = low_memory
+        self.unique_members = Counter()
+        self.unique_online = Counter()
+        self.memberships = 0
+        self.online = 0
+        self.text_channels = 0
+
+    def add_member(self, member):
+        self.memberships += 1
+        if self.low_memory:
+            return
+        self.unique_members[member.id] += 1
+        if _is_online(member):
+            self._set_online(member, True)
+
+    def remove_member(self, member):
+        self.memberships -= 1
+        if self.low_memory:
+            return
+        _decrement(self.unique_members, member.id)
+        if _is_online(member):
+            self._set_online(member, False)
+
+    def update_member(self, before, after):
+        if self.low_memory:
+            return
+        was_online, is_online = _is_online(before), _is_online(after)
+        if was_online != is_online:
+            self._set_online(after, is_online)
+
+    def _set_online(self, member, online):
+        if online:
+            self.online += 1
+            self.unique_online[member.id] += 1
+        else:
+            self.online -= 1
+            _decrement(self.unique_online, member.id)
+
+    def add_guild(self, guild):
+        if self.low_memory:
+            self.memberships += guild.member_count
+        else:
+            for member in guild.members:
+                self.add_member(member)
+        self.text_channels += sum(1 for c in guild.channels if _is_text(c))
+
+    def remove_guild(self, guild):
+        if self.low_memory:
+            self.memberships -= guild.member_count
+        else:
+            for member in guild.members:
+                self.remove_member(member)
+        self.text_channels -= sum(1 for c in guild.channels if _is_text(c))
+
+
+def _decrement(counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
 class Meta:
     """Commands that deal with the bot itself."""
 
     def __init__(self, bot):
         self.bot = bot
+        self.revision = _git_revision()
+        self.stats = Statistics(bot.low_memory)
+        self.reconcile_period = 60 * 60
+        self.task = self.bot.loop.create_task(self._reconcile_statistics())
+
+    def __unload(self):
+        self.task.cancel()
+
+    async def __error(self, ctx, error):
+        if isinstance(error, commands.CommandInvokeError):
+            if isinstance(error.original, (errors.InvalidChannelError, errors.InvalidTemplateError)):
+                await ctx.send(str(error.original))
+        if isinstance(error, commands.BadArgument):
+            await ctx.send(str(error))
+
+    async def _reconcile_statistics(self):
+        """Periodically rebuilds the counters from scratch to correct any drift
+        caused by missed gateway events.
+
+        The rebuild yields to the event loop after every guild so that big
+        guilds don't block it.
+        """
+        while not self.bot.is_closed():
+            await self.bot.wait_until_ready()
+            stats = Statistics(self.bot.low_memory)
+            for guild in list(self.bot.guilds):
+                stats.add_guild(guild)
+                await asyncio.sleep(0)
+            self.stats = stats
+            log.info('Reconciled statistics: %s memberships, %s unique members',
+                     stats.memberships, len(stats.unique_members))
+
+            await asyncio.sleep(self.reconcile_period)
+
+    async def on_member_join(self, member):
+        self.stats.add_member(member)
+
+    async def on_member_remove(self, member):
+        self.stats.remove_member(member)
+
+    async def on_member_update(self, before, after):
+        self.stats.update_member(before, after)
+
+    async def on_guild_join(self, guild):
+        self.stats.add_guild(guild)
+
+    async def on_guild_remove(self, guild):
+        self.stats.remove_guild(guild)
+
+    async def on_guild_channel_create(self, channel):
+        if _is_text(channel):
+            self.stats.text_channels += 1
+
+    async def on_guild_channel_delete(self, channel):
+        if _is_text(channel):
+            self.stats.text_channels -= 1
 
     def _bot_uptime(self):
         now = datetime.datetime.utcnow()
@@ -43,11 +197,47 @@ class Meta:
             return m.author.id == self.bot.user.id
 
         try:
+            await self.bot.outbound.acquire(outbound.MAINTENANCE)
             deleted = await ctx.channel.purge(limit=limit, check=is_me)
             await ctx.send(f'Deleted {len(deleted)} message(s)', delete_after=5)
         except discord.Forbidden:
             await ctx.send('The bot needs the Manage Messages permission to execute this command!')
 
+    @commands.command()
+    async def webhook(self, ctx: commands.Context, channel: discord.TextChannel, enabled: bool = True):
+        """Deliver a channel's notifications of every service through a webhook.
+
+        Use "off" to go back to regular bot messages.
+        """
+        channel = await validate_notification_channel(ctx, channel)
+        async with ctx.typing():
+            if enabled:
+                try:
+                    await self.bot.webhooks.create(channel)
+                except discord.Forbidden:
+                    raise errors.InvalidChannelError('The bot needs the Manage Webhooks permission to do that.')
+            else:
+                await self.bot.webhooks.remove(channel.id)
+
+        state = 'enabled' if enabled else 'disabled'
+        await ctx.send(f'{channel} has webhook notifications {state}.')
+
+    @commands.command()
+    async def template(self, ctx: commands.Context, channel: discord.TextChannel, *, template: str = None):
+        """Customize a channel's notification message for every service.
+
+        Available fields: {name}, {service}, {url}, {viewers}
+        Without a message, the channel goes back to the default one.
+        """
+        channel = await validate_notification_channel(ctx, channel)
+        if template:
+            validate_role_mentions(template, channel, ctx.author)
+            await self.bot.templates.set(channel.id, template)
+            await ctx.send(f'{channel} has a custom notification message.')
+        else:
+            await self.bot.templates.remove(channel.id)
+            await ctx.send(f'{channel} has the default notification message.')
+
     @commands.command(aliases=['join'])
     async def invite(self, ctx: commands.Context):
         """Provide the invite link for the bot. Danny made this command."""
@@ -66,14 +256,7 @@ class Meta:
     @commands.command(aliases=['info', 'source'])
     async def about(self, ctx: commands.Context):
         """Tells you information about the bot itself."""
-        cmd = r'git show -s HEAD~3..HEAD --format="[{}](https://github.com/ivandardi/StreamNotificationBot/commit/%H) %s (%cr)"'
-        if os.name == 'posix':
-            cmd = cmd.format(r'\`%h\`')
-        else:
-            cmd = cmd.format(r'`%h`')
-
-        revision = os.popen(cmd).read().strip()
-        embed = discord.Embed(description='Latest Changes:\n' + revision)
+        embed = discord.Embed(description='Latest Changes:\n' + self.revision)
         embed.title = 'Official Bot Server Invite'
         embed.url = 'https://discord.gg/xrzJhqq'
         embed.colour = 0x738bd7  # blurple
@@ -88,16 +271,14 @@ class Meta:
         embed.timestamp = self.bot.uptime
 
         # statistics
-        total_members = sum(len(s.members) for s in self.bot.guilds)
-        total_online = sum(1 for m in self.bot.get_all_members() if m.status != discord.Status.offline)
-        unique_members = set(self.bot.get_all_members())
-        unique_online = sum(1 for m in unique_members if m.status != discord.Status.offline)
-        text = sum(1 for c in self.bot.get_all_channels() if not isinstance(c, discord.VoiceChannel))
-
-        members = '%s total\n%s online\n%s unique\n%s unique online' % (
-            total_members, total_online, len(unique_members), unique_online)
+        stats = self.stats
+        if stats.low_memory:
+            members = f'{stats.memberships} total'
+        else:
+            members = '%s total\n%s online\n%s unique\n%s unique online' % (
+                stats.memberships, stats.online, len(stats.unique_members), len(stats.unique_online))
         embed.add_field(name='Members', value=members)
-        embed.add_field(name='Channels', value=f'{text} total')
+        embed.add_field(name='Channels', value=f'{stats.text_channels} total')
         embed.add_field(name='Guilds', value=len(self.bot.guilds))
         embed.add_field(name='Uptime', value=self._bot_uptime())
         embed.add_field(name='Bot Version', value=self.bot.version)
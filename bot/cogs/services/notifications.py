@@ -0,0 +1,97 @@
+import itertools
+from collections import OrderedDict
+
+import discord
+
+# Discord allows at most this many fields in a single embed
+MAX_FIELDS_PER_EMBED = 25
+
+# Discord allows at most this many characters in a message
+MAX_CONTENT_LENGTH = 2000
+
+
+class NotificationBatcher:
+    """Groups pending notifications by their destination.
+
+    Notifications queued for the same subscriber are delivered together once
+    the batcher is drained, so that a burst of streamers going online results
+    in a single message per subscriber instead of one message per streamer.
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, subscriber_id: int, streamer):
+        self.pending.setdefault(subscriber_id, []).append(streamer)
+
+    def drain(self):
+        """Returns all pending (subscriber_id, streamers) pairs and clears the batcher"""
+        pending, self.pending = self.pending, OrderedDict()
+        return pending.items()
+
+
+def make_digest_embeds(streamers):
+    """Creates embeds listing several streamers that went online at once"""
+    embeds = []
+    streamers = iter(streamers)
+    while True:
+        chunk = list(itertools.islice(streamers, MAX_FIELDS_PER_EMBED))
+        if not chunk:
+            return embeds
+        embed = discord.Embed(colour=discord.Color.green())
+        embed.set_author(name=f'{len(chunk)} streamers are online!')
+        for streamer in chunk:
+            embed.add_field(
+                name=f'{streamer.channel_name} on {streamer.service_name.capitalize()}',
+                value=f'[{streamer.channel_viewers} viewers]({streamer.stream_url})',
+            )
+        embeds.append(embed)
+
+
+class RenderCache:
+    """Renders notification payloads once per delivery pass.
+
+    Each streamer's embed is created once and each template is rendered once
+    per streamer, no matter how many subscribers they're delivered to.
+    """
+
+    def __init__(self, *, digest_threshold):
+        self.digest_threshold = digest_threshold
+        self._embeds = {}
+        self._contents = {}
+
+    def embed(self, streamer):
+        try:
+            return self._embeds[streamer.service_id]
+        except KeyError:
+            embed = self._embeds[streamer.service_id] = streamer.create_notification_embed()
+            return embed
+
+    def content(self, template, streamer):
+        key = (template, streamer.service_id)
+        try:
+            return self._contents[key]
+        except KeyError:
+            content = self._contents[key] = template.render(streamer)
+            return content
+
+    def embeds(self, streamers):
+        """Creates the embeds to deliver to a single subscriber.
+
+        When the subscriber has fewer than ``digest_threshold`` streamers
+        pending, each streamer gets its own full notification embed, otherwise
+        they're all grouped into digest embeds.
+        """
+        if len(streamers) < self.digest_threshold:
+            return [self.embed(streamer) for streamer in streamers]
+        return make_digest_embeds(streamers)
+
+    def contents(self, template, streamers):
+        """Renders the subscriber's template for each of the streamers, or
+        returns None if the subscriber has no template"""
+        if template is None:
+            return None
+        return '\n'.join(self.content(template, streamer) for streamer in streamers)[:MAX_CONTENT_LENGTH]
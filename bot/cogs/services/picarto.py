@@ -1,22 +1,24 @@
 import logging
 import os
-import re
-from typing import Dict, Type
+from typing import Type
 
-from .service import Service, Streamer, anticache
+from .polling import Capabilities
+from .service import Service, Streamer
 from ...utils import errors, async_cache
 
 log = logging.getLogger(__name__)
 
 
 class PicartoStreamer(Streamer):
+    __slots__ = ('_viewers',)
+
     def __init__(self, *, db_id, service_id, channel_name):
         super().__init__(
             db_id=db_id,
             service_id=service_id,
             channel_name=channel_name
         )
-        self.api = None
+        self._viewers = None
 
     @classmethod
     def from_api_response(cls, api, database):
@@ -27,7 +29,7 @@ class PicartoStreamer(Streamer):
             service_id=service_id,
             channel_name=api['name'],
         )
-        streamer.api = api
+        streamer._viewers = api.get('viewers', None)
         return service_id, streamer
 
     @property
@@ -36,7 +38,7 @@ class PicartoStreamer(Streamer):
 
     @property
     def thumbnail_url(self):
-        return f'https://thumb.picarto.tv/thumbnail/{self.channel_name.lower()}.jpg' + anticache()
+        return f'https://thumb.picarto.tv/thumbnail/{self.channel_name.lower()}.jpg'
 
     @property
     def service_icon_url(self):
@@ -44,7 +46,7 @@ class PicartoStreamer(Streamer):
 
     @property
     def channel_viewers(self):
-        return self.api['viewers']
+        return self._viewers
 
     @property
     def stream_url(self):
@@ -58,6 +60,13 @@ class PicartoStreamer(Streamer):
 class Picarto(Service):
     """Picarto notifications"""
 
+    capabilities = Capabilities(
+        max_batch_size=1,
+        bulk_listing=True,
+        listing_cost=50,
+        listing_item_cost=0.05,
+    )
+
     def __init__(self, bot):
         super().__init__(
             bot=bot,
@@ -72,18 +81,6 @@ class Picarto(Service):
     async def __error(self, ctx, error):
         await self._cog__error(ctx, error)
 
-    async def get_online_streamers(self) -> Dict[str, Streamer]:
-        all_online_streamers = await self.get_all_online_streamers()
-
-        db = await self.database_streamers()
-        online_streamers = dict(
-            PicartoStreamer.from_api_response(s, db)
-            for s in all_online_streamers
-            if str(s['user_id']) in db
-        )
-
-        return online_streamers
-
     @async_cache()
     async def get_streamer_from_API(self, username: str) -> PicartoStreamer:
         streamer = await self.get_channel_by_name(username)
@@ -91,16 +88,26 @@ class Picarto(Service):
             raise errors.StreamerNotFoundError(username)
         return PicartoStreamer.from_api_response(
             api=streamer,
-            database=await self.database_streamers(),
+            database={},
         )[1]
 
-    async def get_all_online_streamers(self):
+    async def fetch_batch(self, streamers):
+        (streamer,) = streamers
+        channel = await self.api_request(endpoint=f'/channel/name/{streamer.channel_name}')
+        if channel is None:
+            return None
+        return [channel] if channel.get('online') else []
+
+    async def fetch_listing(self):
         params = {
             'adult': 'true',
             'gaming': 'true',
         }
         return await self.api_request(endpoint='/online', params=params)
 
+    def stream_id(self, api):
+        return str(api['user_id'])
+
     @async_cache()
     async def get_channel_by_name(self, username: str):
         return await self.api_request(endpoint=f'/channel/name/{username}')
@@ -110,18 +117,13 @@ class Picarto(Service):
             'Accept': 'application/json',
             'Content-Type': 'application/json',
         }
-        async with self.bot.session.get('https://api.picarto.tv/v1' + endpoint, headers=headers, params=params) as r:
-            if r.status != 200:
-                return None
-            return await r.json()
-
-    async def validate_username(self, username: str) -> str:
-        if not username:
-            raise errors.InvalidUsernameError(username)
-        if not re.fullmatch(r'^\w{3,24}$', username, re.IGNORECASE):
-            raise errors.InvalidUsernameError(username)
-
-        return username.lower()
+        async with self.poller.limiter:
+            async with self.bot.session.get('https://api.picarto.tv/v1' + endpoint, headers=headers, params=params) as r:
+                if r.status != 200:
+                    return None
+                if r.content_type != 'application/json':
+                    raise errors.UnexpectedApiError(f'HTTP {r.status} ({r.content_type})')
+                return await r.json()
 
     def stream_url(self, username: str) -> str:
         return f'https://picarto.tv/{username}'
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict
+from typing import NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class Capabilities(NamedTuple):
+    """What a streaming service's API can do, as declared by its adapter.
+
+    :param max_batch_size: How many channels can be looked up in a single
+        request, or 0 if the service can't look up channels by id
+    :param bulk_listing: Whether the service can list every online stream
+    :param listing_cost: Estimated cost of a bulk listing, in requests, used
+        until a listing has been fetched
+    :param listing_item_cost: Cost of every stream in a bulk listing, in
+        requests, to account for downloading and parsing big listings
+    :param push: Whether the service can push go-live events to us
+    :param rate_limit_headers: The (remaining, reset) response headers, if the
+        service reports its rate limits
+    :param concurrency: How many requests can be in flight at once
+    """
+    max_batch_size: int = 0
+    bulk_listing: bool = False
+    listing_cost: float = 1
+    listing_item_cost: float = 0
+    push: bool = False
+    rate_limit_headers: Optional[Tuple[str, str]] = None
+    concurrency: int = 4
+
+
+class RequestLimiter:
+    """Limits the concurrency of requests to a service and respects the rate
+    limits that it reports through its response headers.
+
+    Usage::
+
+        async with limiter:
+            async with session.get(...) as r:
+                limiter.update(r.headers)
+    """
+
+    def __init__(self, capabilities: Capabilities):
+        self.headers = capabilities.rate_limit_headers
+        self.semaphore = asyncio.Semaphore(capabilities.concurrency)
+        self.remaining = None
+        self.reset_at = None
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            await self._wait_for_reset()
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+    def has_headroom(self, reserve: int) -> bool:
+        """Whether more than ``reserve`` requests are left in the current rate limit window"""
+        if self.remaining is None:
+            return True
+        return self.remaining > reserve or (self.reset_at is not None and self.reset_at <= time.time())
+
+    async def _wait_for_reset(self):
+        if self.remaining is None or self.remaining > 0 or self.reset_at is None:
+            return
+        delay = self.reset_at - time.time()
+        if delay > 0:
+            log.warning('Rate limited, waiting %.2fs', delay)
+            await asyncio.sleep(delay)
+        self.remaining = None
+
+    def update(self, headers):
+        if not self.headers:
+            return
+        remaining_header, reset_header = self.headers
+        try:
+            self.remaining = int(headers[remaining_header])
+            self.reset_at = int(headers[reset_header])
+        except (KeyError, ValueError):
+            pass
+
+
+class CircuitBreaker:
+    """Stops polling a service that keeps failing.
+
+    After ``failure_threshold`` consecutive failed polls the breaker opens and
+    polls are skipped for ``cooldown`` seconds. Then a single probe poll is
+    let through (half-open): if it succeeds the breaker closes, otherwise it
+    opens again with the cooldown doubled, up to ``max_cooldown``.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, *, failure_threshold=3, base_cooldown=60, max_cooldown=60 * 60):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = base_cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+
+    def allow(self) -> bool:
+        """Whether a poll may run now"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            log.info('Circuit breaker half-open, probing')
+        return self.state != self.OPEN
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log.info('Circuit breaker closed')
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self, error):
+        self.failures += 1
+        self.last_error = error
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        log.warning('Circuit breaker open for %ss after %s failures: %s',
+                    self.cooldown, self.failures, self.last_error)
+
+    def __str__(self):
+        if self.state == self.OPEN:
+            remaining = max(0, self.cooldown - (time.monotonic() - self.opened_at))
+            return f'{self.state} ({self.failures} failures, retrying in {remaining:.0f}s, last error: {self.last_error})'
+        return f'{self.state} ({self.failures} failures)'
+
+
+class PlanStats:
+    __slots__ = ('runs', 'cost', 'seconds')
+
+    def __init__(self):
+        self.runs = 0
+        self.cost = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        if not self.runs:
+            return 'never ran'
+        return (f'{self.runs} runs, {self.cost / self.runs:.1f} requests/run, '
+                f'{self.seconds / self.runs:.2f}s/run')
+
+
+class PollingEngine:
+    """Fetches the online streamers of a service with the cheapest plan that
+    its capabilities allow.
+
+    The cost of a batched poll is the number of batch requests needed for the
+    tracked streamers, while the cost of a bulk listing grows with the size of
+    the last listing fetched. A plan can also be forced by setting
+    :attr:`forced_plan` to ``'batch'`` or ``'listing'``.
+
+    The service acts as the adapter, implementing ``fetch_batch`` if it
+    supports batched lookups, ``fetch_listing`` if it supports bulk listings,
+    ``stream_id`` to get the service id of an API response, and
+    ``parse_stream`` to turn the API responses of tracked streamers into
+    streamers.
+    """
+
+    PLANS = ('batch', 'listing')
+
+    def __init__(self, service):
+        self.service = service
+        self.capabilities = service.capabilities
+        self.limiter = RequestLimiter(self.capabilities)
+        self.breaker = CircuitBreaker(base_cooldown=service.update_period)
+        self.last_plan = None
+        self.last_unknown = set()
+        self.last_listing_size = None
+        self.forced_plan = None
+        self.plan_stats = defaultdict(PlanStats)
+
+    def batch_cost(self, tracked: int) -> int:
+        if not self.capabilities.max_batch_size:
+            return math.inf
+        return math.ceil(tracked / self.capabilities.max_batch_size)
+
+    def listing_cost(self) -> float:
+        if not self.capabilities.bulk_listing:
+            return math.inf
+        if self.last_listing_size is None:
+            return self.capabilities.listing_cost
+        return 1 + self.last_listing_size * self.capabilities.listing_item_cost
+
+    def supports(self, plan: str) -> bool:
+        """Returns whether the service's capabilities allow the plan"""
+        if plan == 'batch':
+            return bool(self.capabilities.max_batch_size)
+        if plan == 'listing':
+            return self.capabilities.bulk_listing
+        return False
+
+    def choose_plan(self, tracked: int) -> str:
+        if self.forced_plan:
+            return self.forced_plan
+        if self.batch_cost(tracked) <= self.listing_cost():
+            return 'batch'
+        if self.capabilities.bulk_listing:
+            return 'listing'
+        raise RuntimeError(f'{self.service.service_name} has no way of fetching online streamers')
+
+    async def poll(self, database):
+        """Returns the online streamers among the ones in the database
+
+        Streamers whose status couldn't be fetched, because their batch or the
+        listing failed, are neither online nor offline: their service ids are
+        left in :attr:`last_unknown`. While the circuit breaker is open, every
+        streamer is unknown.
+
+        :param database: The tracked streamers, keyed by service id
+        :return: The online streamers, keyed by service id
+        """
+        self.last_unknown = set()
+        if not database:
+            return {}
+        if not self.breaker.allow():
+            self.last_unknown = set(database)
+            return {}
+
+        try:
+            online_streamers = await self._poll(database)
+        except Exception as e:  # noqa
+            log.exception('Failed to poll %s: %s', self.service.service_name, e)
+            self.last_unknown = set(database)
+            self.breaker.record_failure(f'{type(e).__name__}: {e}')
+            return {}
+
+        if self.last_unknown == set(database):
+            self.breaker.record_failure('every request failed')
+        else:
+            self.breaker.record_success()
+        return online_streamers
+
+    async def _poll(self, database):
+        self.last_plan = plan = self.choose_plan(len(database))
+        started = time.perf_counter()
+        if plan == 'batch':
+            cost = self.batch_cost(len(database))
+            streams = await self._poll_batches(database)
+        else:
+            streams = await self.service.fetch_listing()
+            if streams is None:
+                log.error('Failed to fetch the %s listing', self.service.service_name)
+                self.last_unknown = set(database)
+                return {}
+            self.last_listing_size = len(streams)
+            cost = self.listing_cost()
+
+        stats = self.plan_stats[plan]
+        stats.runs += 1
+        stats.cost += cost
+        stats.seconds += time.perf_counter() - started
+        log.debug('Polled %s %s streamers with plan %s (cost %s)', len(database), self.service.service_name, plan, cost)
+
+        # listings hold every stream of the service, so only the tracked ones are parsed
+        return dict(
+            self.service.parse_stream(api, database)
+            for api in streams
+            if self.service.stream_id(api) in database
+        )
+
+    async def _poll_batches(self, database):
+        size = self.capabilities.max_batch_size
+        streamers = list(database.values())
+        batches = [streamers[i:i + size] for i in range(0, len(streamers), size)]
+        results = await asyncio.gather(*(self.service.fetch_batch(batch) for batch in batches), return_exceptions=True)
+
+        streams = []
+        for batch, result in zip(batches, results):
+            if result is None or isinstance(result, Exception):
+                log.error('Failed to fetch a batch of %s %s streamers: %r',
+                          len(batch), self.service.service_name, result)
+                self.last_unknown.update(s.service_id for s in batch)
+                continue
+            streams.extend(result)
+        return streams
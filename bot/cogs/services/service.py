@@ -1,31 +1,33 @@
 import asyncio
-import itertools
 import logging
-import random
-from abc import ABC, abstractmethod
+import re
+import time
+from abc import ABC, ABCMeta, abstractmethod
+from collections import Counter
 from typing import Dict, Type, Optional, Union
 
 import discord
 from discord.ext import commands
 
-from ...utils import errors, strings
+from .notifications import NotificationBatcher, RenderCache
+from .polling import Capabilities, PollingEngine
+from ...utils import errors, outbound, strings, Throttle
+from ...utils.delivery import encode_notification
+from ...utils.thumbnails import anticache
+from ...utils.webhooks import message_count
 
 log = logging.getLogger(__name__)
 
+# Requests kept for the poll loop: API-backed commands can't use these concurrency slots
+# nor the last requests of a rate limit window
+RESERVED_POLL_CONCURRENCY = 1
+RESERVED_POLL_REQUESTS = 20
 
-def anticache():
-    rand = lambda: random.randint(0, 2 ** 64 - 1)
-    return f'?useless_int={rand()}'
+# Notifications delivered at once by each service
+DELIVERY_CONCURRENCY = 32
 
-
-def chunks(collection, n):
-    """Yield successive n-sized chunks from collection."""
-    collection = iter(collection)
-    while True:
-        chunk = list(itertools.islice(collection, n))
-        if not chunk:
-            return
-        yield chunk
+# Seconds between the first poll of each loaded service, so that they don't all hit the network at once
+START_STAGGER = 10
 
 
 async def validate_notification_channel(ctx, channel: discord.abc.GuildChannel):
@@ -61,10 +63,21 @@ class Subscriber:
         return str(self.subscriber)
 
     async def send(self, *args, **kwargs):
-        await self.subscriber.send(*args, **kwargs)
+        return await self.subscriber.send(*args, **kwargs)
+
+    async def send_embeds(self, embeds, content=None):
+        messages = []
+        for embed in embeds:
+            messages.append(await self.send(content=content, embed=embed))
+            content = None
+        return messages
+
+
+class TrackedStreamer:
+    """A streamer tracked in the database, with only the fields that polling needs"""
 
+    __slots__ = ('db_id', 'service_id', 'channel_name')
 
-class Streamer(ABC):
     def __init__(self, *, db_id, service_id, channel_name):
         self.db_id = db_id
         self.service_id = service_id
@@ -78,7 +91,29 @@ class Streamer(ABC):
             channel_name=record['username'],
         )
 
-    def create_notification_embed(self):
+
+class Streamer(metaclass=ABCMeta):
+    """A streamer seen in an API response.
+
+    Streamers use ``__slots__`` and subclasses extract the few fields that the
+    notifications need from API responses, instead of keeping the responses
+    around, since there's one instance per live streamer. The base class isn't
+    :class:`abc.ABC`, which has no ``__slots__`` before Python 3.7 and would
+    give every instance a ``__dict__``.
+    """
+
+    __slots__ = ('db_id', 'service_id', 'channel_name', 'thumbnail_version', 'started_at', 'trace')
+
+    def __init__(self, *, db_id, service_id, channel_name):
+        self.db_id = db_id
+        self.service_id = service_id
+        self.channel_name = channel_name
+        self.thumbnail_version = None
+        # when the stream started as a UNIX timestamp, if the service says
+        self.started_at = None
+        self.trace = None
+
+    def create_notification_embed(self, *, uptime=None):
         embed = discord.Embed(
             colour=discord.Color.green(),
             url=self.stream_url,
@@ -89,16 +124,49 @@ class Streamer(ABC):
             url=self.stream_url,
             icon_url=self.service_icon_url,
         )
-        embed.set_image(url=self.thumbnail_url)
+        embed.set_image(url=self.versioned_thumbnail_url)
         embed.set_thumbnail(url=self.avatar_url)
         embed.set_footer(text=self.service_name.capitalize())
         embed.add_field(name='Viewers', value=str(self.channel_viewers))
+        if uptime:
+            embed.add_field(name='Uptime', value=uptime)
+
+        return embed
+
+    def create_offline_embed(self, uptime):
+        embed = discord.Embed(
+            colour=discord.Color.light_grey(),
+            url=self.stream_url,
+            description=self.stream_url
+        )
+        embed.set_author(
+            name=f'{self.channel_name} was online on {self.service_name.capitalize()}',
+            url=self.stream_url,
+            icon_url=self.service_icon_url,
+        )
+        embed.set_thumbnail(url=self.avatar_url)
+        embed.set_footer(text=self.service_name.capitalize())
+        embed.add_field(name='Status', value='Offline')
+        embed.add_field(name='Streamed for', value=uptime)
 
         return embed
 
     def __eq__(self, other):
         return self.service_id == other.service_id
 
+    @property
+    def versioned_thumbnail_url(self) -> str:
+        """The thumbnail URL with a version that changes once per go-live, so that
+        every notification of the go-live shares the same image in Discord's media proxy"""
+        if self.thumbnail_version is None:
+            self.thumbnail_version = self.session_id or anticache()
+        return f'{self.thumbnail_url}?v={self.thumbnail_version}'
+
+    @property
+    def session_id(self) -> Optional[str]:
+        """Identifies the stream session, if the service provides a way to"""
+        return None
+
     @property
     @abstractmethod
     def service_name(self) -> str:
@@ -131,15 +199,41 @@ class Streamer(ABC):
 
 
 class Service(ABC):
-    """Base Service class"""
+    """Base Service class
+
+    A streaming service is added by subclassing this class as an adapter: it
+    declares its API's :class:`Capabilities` and implements the fetch methods
+    that those capabilities allow, while :class:`PollingEngine` decides how
+    to fetch the online streamers on every tick.
+    """
+
+    capabilities = Capabilities()
+    username_pattern = r'^\w{3,24}$'
 
-    def __init__(self, *, bot, service_name, api_key, update_period):
+    def __init__(self, *, bot, service_name, api_key, update_period, coalesce_window=0, digest_threshold=3,
+                 offline_grace_period=None):
         self.bot = bot
         self.service_name = service_name
         self.api_key = api_key
         self.update_period = update_period
+        self.offline_grace_period = 3 * update_period if offline_grace_period is None else offline_grace_period
+        self.last_seen = {}
+        self.notified_sessions = {}
+        self.coalesce_window = coalesce_window
+        self.digest_threshold = digest_threshold
+        self.pending_notifications = NotificationBatcher()
+        self._last_delivery = 0
+        self.polls = 0
+        self.poll_started = None
+        self.poll_finished = None
         self.live_streamers_cache = {}
         self.disabled_users = set()
+        self.poller = PollingEngine(self)
+        self.throttle = Throttle()
+        self.delivery_semaphore = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+        self.command_semaphore = asyncio.Semaphore(
+            max(1, self.capabilities.concurrency - RESERVED_POLL_CONCURRENCY))
+        self.start_delay = START_STAGGER * sum(1 for cog in self.bot.cogs.values() if isinstance(cog, Service))
         setattr(self, self.service_name, self._make_commands())
 
         self.task = self.bot.loop.create_task(self._notify_subscribers())
@@ -160,6 +254,10 @@ class Service(ABC):
                 await ctx.send("You're already subscribed to this streamer!")
             if isinstance(original, errors.InvalidChannelError):
                 await ctx.send(str(original))
+            if isinstance(original, errors.InvalidTemplateError):
+                await ctx.send(str(original))
+            if isinstance(original, errors.CommandThrottledError):
+                await ctx.send(f"You're doing that too much. {str(original)}")
         if isinstance(error, commands.BadArgument):
             await ctx.send(str(error))
 
@@ -207,6 +305,13 @@ class Service(ABC):
         )
         cmd.instance = self
         group.add_command(cmd)
+        cmd = commands.Command(
+            name='stats',
+            callback=self._stats_command,
+            help=self._make_help_string(strings.stats_command_help),
+        )
+        cmd.instance = self
+        group.add_command(cmd)
 
         return group
 
@@ -224,6 +329,7 @@ class Service(ABC):
         """add command"""
         username = await self.validate_username(username)
         channel = await validate_notification_channel(ctx, channel)
+        self.throttle.hit(ctx)
         async with ctx.typing():
             subscriber = Subscriber(channel or ctx.author)
             await self._subscribe_to_streamer(subscriber, username)
@@ -231,7 +337,13 @@ class Service(ABC):
         await ctx.send(f'{subscriber} subscribed to {username} successfully!')
 
     async def _subscribe_to_streamer(self, subscriber: Subscriber, username: str):
-        streamer = await self.get_streamer_from_API(username)
+        if not self.poller.limiter.has_headroom(RESERVED_POLL_REQUESTS):
+            reset_at = self.poller.limiter.reset_at
+            # without a reset time, the window should be over by the next poll
+            retry_after = reset_at - time.time() if reset_at is not None else self.update_period
+            raise errors.CommandThrottledError(max(0, retry_after))
+        async with self.command_semaphore:
+            streamer = await self.get_streamer_from_API(username)
         await self._add_subscription(subscriber, streamer)
 
     async def _add_subscription(self, subscriber: Subscriber, streamer: Streamer):
@@ -298,6 +410,30 @@ class Service(ABC):
         self.disabled_users.add(subscriber.id)
         await ctx.send(f'{subscriber.subscriber} has notifications disabled.')
 
+    @staticmethod
+    async def _stats_command(self, ctx, username: str = None):
+        username = await self.validate_username(username)
+        async with ctx.typing():
+            stats = await self.bot.database.get_stream_stats(service=self.service_name, username=username)
+            if not stats or not stats['sessions']:
+                return await ctx.send(f'No stream history for {username} yet.')
+            embed = self._make_stats_embed(username, stats)
+
+        await ctx.send(embed=embed)
+
+    def _make_stats_embed(self, username, stats):
+        duration = stats['duration_seconds']
+        hours, remainder = divmod(duration, 3600)
+        average_viewers = stats['viewer_seconds'] // duration if duration else 0
+
+        embed = discord.Embed(color=discord.Color.blue(), url=self.stream_url(username))
+        embed.set_author(name=f'{self.service_name.capitalize()} stream history for {username}')
+        embed.add_field(name='Streams', value=str(stats['sessions']))
+        embed.add_field(name='Time streamed', value=f'{hours}h {remainder // 60}m')
+        embed.add_field(name='Peak viewers', value=str(stats['peak_viewers']))
+        embed.add_field(name='Average viewers', value=str(average_viewers))
+        return embed
+
     async def on_private_channel_delete(self, channel: discord.abc.PrivateChannel):
         log.info('Private channel deleted')
         await self._remove_channels_from_database([channel])
@@ -314,50 +450,219 @@ class Service(ABC):
         for channel in channels:
             log.info('Deleting subscriber channel %s (%s) from database...', channel, channel.id)
             await self.bot.database.delete_subscriber(subscriber_id=channel.id)
+            await self.bot.webhooks.remove(channel.id)
+            await self.bot.templates.remove(channel.id)
             log.info('Deletion successful: %s (%s)', channel, channel.id)
 
     async def database_streamers(self):
         database_streamers = await self.bot.database.get_all_streamers_from_service(service=self.service_name)
         database_streamers = {
-            s['service_id']: self.streamer_class.from_database_record(s) for s in database_streamers
+            s['service_id']: TrackedStreamer.from_database_record(s) for s in database_streamers
         }
         return database_streamers
 
     async def _notify_subscribers(self):
+        await self.bot.wait_until_ready()
+        await asyncio.sleep(self.start_delay)
         while not self.bot.is_closed():
             await self.bot.wait_until_ready()
             try:
                 log.debug('Checking %s streamers', self.service_name)
+                self.poll_started = time.time()
                 currently_online_streamers = await self.get_online_streamers()
-                for service_id, streamer in currently_online_streamers.items():
-                    if service_id not in self.live_streamers_cache:
-                        await self._notify_subscribers_of_streamer(streamer)
-                self.live_streamers_cache = currently_online_streamers
+                self.poll_finished = time.time()
+                self.polls += 1
+                await self._update_live_streamers(currently_online_streamers, self.poller.last_unknown)
+                if self.bot.loop.time() - self._last_delivery >= self.coalesce_window:
+                    await self._deliver_notifications()
             except Exception as e:  # noqa
                 log.exception('_notify_subscribers: %s', e)
 
             await asyncio.sleep(self.update_period)
 
+    async def _update_live_streamers(self, online_streamers, unknown):
+        """Notifies about the streamers that went online and forgets about the
+        ones that went offline.
+
+        A streamer is only considered offline once they haven't been seen for
+        ``offline_grace_period`` seconds, so that a stream dropping for a tick
+        doesn't notify everyone again when it comes back. Streamers whose
+        status is unknown count as seen. A streamer that comes back with a
+        session that was already notified about isn't notified again either,
+        while a new session is notified about even if the previous one started
+        ending within the grace period.
+        """
+        now = self.bot.loop.time()
+        for service_id, streamer in online_streamers.items():
+            session_id = streamer.session_id
+            notified_session_id = self.notified_sessions.get(service_id)
+            if service_id not in self.live_streamers_cache:
+                notify = session_id is None or session_id != notified_session_id
+            else:
+                notify = session_id is not None and notified_session_id is not None and \
+                    session_id != notified_session_id
+                if notify:
+                    # the previous session ended within the grace period
+                    await self.bot.history.end(self.service_name, service_id)
+                    self.bot.live_updates.end(self.service_name, service_id)
+            if notify:
+                await self._notify_subscribers_of_streamer(streamer)
+                self.notified_sessions[service_id] = session_id
+            self.live_streamers_cache[service_id] = streamer
+            self.last_seen[service_id] = now
+            self.bot.history.observe(self.service_name, service_id, streamer.channel_viewers)
+
+        for service_id in unknown:
+            if service_id in self.live_streamers_cache:
+                self.last_seen[service_id] = now
+
+        ended = []
+        for service_id, last_seen in list(self.last_seen.items()):
+            if now - last_seen > self.offline_grace_period:
+                del self.last_seen[service_id]
+                self.live_streamers_cache.pop(service_id, None)
+                await self.bot.history.end(self.service_name, service_id)
+                self.bot.thumbnails.forget((self.service_name, service_id))
+                ended.append(service_id)
+
+        self.bot.live_updates.update(self.service_name, online_streamers, ended)
+
     async def _notify_subscribers_of_streamer(self, streamer: Streamer):
+        """Queues a notification for every subscriber of the streamer.
+
+        The notifications are sent by :meth:`_deliver_notifications`, which
+        groups them per subscriber.
+        """
+        streamer.thumbnail_version = self.bot.thumbnails.version(
+            (self.service_name, streamer.service_id), streamer.session_id)
+        trace = streamer.trace = self.bot.tracer.start(
+            self.service_name,
+            streamer,
+            polled_at=self.poll_started,
+            detected_at=self.poll_finished,
+            catch_up=self.polls <= 1,
+        )
+
+        started = time.time()
         subscribers = await self.bot.database.get_subscribers_from_streamer(streamer.db_id)
+        trace.queued_at = time.time()
+        trace.span('lookup', started, trace.queued_at)
+        if not subscribers:
+            return
+
         for (subscriber_id,) in subscribers:
             if subscriber_id in self.disabled_users:
                 continue
-            subscriber = await self._get_subscriber(subscriber_id)
-            if subscriber:
-                notification_embed = streamer.create_notification_embed()
-                try:
-                    await subscriber.send(embed=notification_embed)
-                    log.info('Notified %s that streamer %s is online on %s',
-                             subscriber, streamer.channel_name, streamer.service_name)
-                except discord.Forbidden as e:
-                    log.exception('_notify_subscribers_of_streamer: No permissions to send the message.\n%s', e)
-                except discord.HTTPException as e:
-                    log.exception('_notify_subscribers_of_streamer: Sending the message failed.\n%s', e)
-                except Exception as e:
-                    log.exception('_notify_subscribers_of_streamer: General exception.\n%s', e)
-            else:
-                log.error('_notify_subscribers_of_streamer: Subscriber not found: %s', subscriber_id)
+            self.pending_notifications.add(subscriber_id, streamer)
+
+    async def _deliver_notifications(self):
+        """Delivers the pending notifications.
+
+        Up to ``DELIVERY_CONCURRENCY`` deliveries run concurrently and are
+        scheduled by the bot's outbound scheduler, keyed by streamer so that
+        every streamer's subscribers get their turn. If the bot runs with
+        delivery workers, the notifications are queued for them instead.
+        """
+        self._last_delivery = self.bot.loop.time()
+        render_cache = RenderCache(digest_threshold=self.digest_threshold)
+        if self.bot.delivery_workers:
+            return await self._enqueue_notifications(render_cache)
+
+        delivered, failed = Counter(), Counter()
+        await asyncio.gather(*(
+            self._deliver_notification(subscriber_id, streamers, render_cache, delivered, failed)
+            for subscriber_id, streamers in self.pending_notifications.drain()
+        ))
+
+        for channel_name in delivered.keys() | failed.keys():
+            log.info('Notified %s subscriber(s) that %s is online on %s (%s failed)',
+                     delivered[channel_name], channel_name, self.service_name, failed[channel_name])
+
+    async def _enqueue_notifications(self, render_cache):
+        notifications = []
+        pending = self.pending_notifications.drain()
+        for subscriber_id, streamers in pending:
+            embeds = render_cache.embeds(streamers)
+            content = render_cache.contents(await self.bot.templates.get(subscriber_id), streamers)
+            notifications.append((subscriber_id, streamers[0].service_id, encode_notification(embeds, content)))
+            self._record_thumbnail_uses(streamers)
+
+        if notifications:
+            await self.bot.database.enqueue_notifications(notifications)
+            # the delivery workers don't trace, so the traces end when the notifications are handed off
+            queued = time.time()
+            for subscriber_id, streamers in pending:
+                for streamer in streamers:
+                    if streamer.trace and streamer.trace.queued_at:
+                        streamer.trace.span('queueing', streamer.trace.queued_at, queued, subscriber_id=subscriber_id)
+            log.info('Queued %s notification(s) on %s for the delivery workers', len(notifications), self.service_name)
+
+    def _record_thumbnail_uses(self, streamers):
+        """Counts the thumbnail URLs of the notification embeds sent to a subscriber"""
+        if len(streamers) < self.digest_threshold:
+            for streamer in streamers:
+                self.bot.thumbnails.record_use((self.service_name, streamer.service_id), streamer.thumbnail_version)
+
+    @staticmethod
+    def _trace(streamers, stage, start, end, subscriber_id):
+        for streamer in streamers:
+            if streamer.trace:
+                streamer.trace.span(stage, start, end, subscriber_id=subscriber_id)
+
+    async def _deliver_notification(self, subscriber_id, streamers, render_cache, delivered, failed):
+        async with self.delivery_semaphore:
+            await self._deliver_notification_now(subscriber_id, streamers, render_cache, delivered, failed)
+
+    async def _deliver_notification_now(self, subscriber_id, streamers, render_cache, delivered, failed):
+        started = time.time()
+        for streamer in streamers:
+            if streamer.trace and streamer.trace.queued_at:
+                streamer.trace.span('queueing', streamer.trace.queued_at, started, subscriber_id=subscriber_id)
+        subscriber = await self._get_subscriber(subscriber_id)
+        self._trace(streamers, 'resolution', started, time.time(), subscriber_id)
+        if subscriber:
+            embeds = render_cache.embeds(streamers)
+            content = render_cache.contents(await self.bot.templates.get(subscriber_id), streamers)
+            try:
+                key = streamers[0].service_id
+                webhook = await self.bot.webhooks.get(subscriber.id)
+                cost = message_count(len(embeds)) if webhook else len(embeds)
+                started = time.time()
+                await self.bot.outbound.acquire(outbound.NOTIFICATION, key=key, cost=cost)
+                self._trace(streamers, 'scheduling', started, time.time(), subscriber_id)
+                started = time.time()
+                remaining = await self.bot.webhooks.send(subscriber.id, embeds, content=content)
+                if remaining:
+                    if webhook:
+                        # the webhook is gone, so the messages sent instead weren't accounted for
+                        await self.bot.outbound.acquire(outbound.NOTIFICATION, key=key, cost=len(remaining))
+                    # the content goes with the first message, so only send it if that wasn't delivered
+                    if len(remaining) < len(embeds):
+                        content = None
+                    messages = await subscriber.send_embeds(remaining, content=content)
+                    if len(messages) == len(streamers):
+                        for streamer, message, embed in zip(streamers, messages, embeds):
+                            self.bot.live_updates.track(streamer, message, embed)
+                sent = time.time()
+                self._trace(streamers, 'send', started, sent, subscriber_id)
+                for streamer in streamers:
+                    if streamer.trace:
+                        streamer.trace.delivered(sent, subscriber_id=subscriber_id)
+                delivered.update(s.channel_name for s in streamers)
+                self._record_thumbnail_uses(streamers)
+                log.debug('Notified %s that %s streamer(s) are online on %s: %s',
+                          subscriber, len(streamers), self.service_name,
+                          ', '.join(s.channel_name for s in streamers))
+                return
+            except discord.Forbidden as e:
+                log.exception('_deliver_notification: No permissions to send the message.\n%s', e)
+            except discord.HTTPException as e:
+                log.exception('_deliver_notification: Sending the message failed.\n%s', e)
+            except Exception as e:
+                log.exception('_deliver_notification: General exception.\n%s', e)
+        else:
+            log.error('_deliver_notification: Subscriber not found: %s', subscriber_id)
+        failed.update(s.channel_name for s in streamers)
 
     async def _get_subscriber(self, subscriber_id: int) -> Optional[Subscriber]:
         channel = self.bot.get_channel(subscriber_id)
@@ -376,25 +681,61 @@ class Service(ABC):
         if channel:
             return Subscriber(channel)
 
+        if self.bot.low_memory:
+            try:
+                return Subscriber(await self.bot.get_user_info_cached(subscriber_id))
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                log.error('_get_subscriber: Failed to fetch user %s: %s', subscriber_id, e)
+                return None
+
         # we tried. if we reach here, we might as well remove the subscriber
         # from the database
         log.info('Deleting subscriber %s from database...', subscriber_id)
         await self.bot.database.delete_subscriber(subscriber_id=subscriber_id)
         log.info('Deletion successful: %s', subscriber_id)
 
-    @abstractmethod
     async def get_online_streamers(self) -> Dict[str, Streamer]:
         """Retrieves all streamers that are online and that have
         at least one subscriber in the database
         """
+        return await self.poller.poll(await self.database_streamers())
+
+    async def fetch_batch(self, streamers) -> Optional[list]:
+        """Fetches the streams of the given tracked streamers that are online.
+
+        Required if ``capabilities.max_batch_size`` is set.
+
+        :return: The API responses of the online streams, or None if the request failed
+        """
         raise NotImplementedError
 
-    @abstractmethod
-    async def get_streamer_from_API(self, username: str) -> Streamer:
+    async def fetch_listing(self) -> list:
+        """Fetches every online stream in the service.
+
+        Required if ``capabilities.bulk_listing`` is set.
+        """
+        raise NotImplementedError
+
+    def stream_id(self, api) -> str:
+        """Returns the service id of an API response from a fetch method, without parsing the rest of it"""
         raise NotImplementedError
 
+    def parse_stream(self, api, database):
+        """Turns an API response from a fetch method into a (service_id, streamer) pair"""
+        return self.streamer_class.from_api_response(api, database)
+
+    async def validate_username(self, username: str) -> str:
+        if not username:
+            raise errors.InvalidUsernameError(username)
+        if not re.fullmatch(self.username_pattern, username, re.IGNORECASE):
+            raise errors.InvalidUsernameError(username)
+
+        return username.lower()
+
     @abstractmethod
-    async def validate_username(self, username: str):
+    async def get_streamer_from_API(self, username: str) -> Streamer:
         raise NotImplementedError
 
     @abstractmethod
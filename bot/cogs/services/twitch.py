@@ -1,9 +1,10 @@
+import datetime
 import logging
 import os
-import re
-from typing import Dict, Type
+from typing import Type
 
-from .service import Service, Streamer, chunks, anticache
+from .polling import Capabilities
+from .service import Service, Streamer
 from ...utils import errors, async_cache
 
 log = logging.getLogger(__name__)
@@ -22,24 +23,41 @@ def _get_service_id(api):
 
 
 class TwitchStreamer(Streamer):
+    __slots__ = ('_thumbnail_url', '_session_id', '_viewers', '_stream_url', '_avatar_url')
+
     def __init__(self, *, db_id, service_id, channel_name):
         super().__init__(
             db_id=db_id,
             service_id=service_id,
             channel_name=channel_name
         )
-        self.api = None
+        self._thumbnail_url = None
+        self._session_id = None
+        self._viewers = None
+        self._stream_url = None
+        self._avatar_url = None
 
     @classmethod
     def from_api_response(cls, api, database):
         service_id = _get_service_id(api)
         database_streamer = database.get(service_id, None)
+        channel = api.get('channel', None)
         streamer = cls(
             db_id=database_streamer.db_id if database_streamer else None,
             service_id=service_id,
-            channel_name=api.get('display_name', None) or api['channel']['display_name'],
+            channel_name=api.get('display_name', None) or channel['display_name'],
         )
-        streamer.api = api
+        # only the fields that the notifications need are kept, not the whole response
+        if channel:
+            session_id = api.get('_id') or api.get('created_at')
+            streamer._session_id = str(session_id) if session_id else None
+            streamer._thumbnail_url = api['preview']['large']
+            streamer._viewers = api['viewers']
+            streamer._stream_url = channel['url']
+            if api.get('created_at'):
+                started_at = datetime.datetime.strptime(api['created_at'], '%Y-%m-%dT%H:%M:%SZ')
+                streamer.started_at = started_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+        streamer._avatar_url = api.get('logo', None) or (channel and channel['logo'])
         return service_id, streamer
 
     @property
@@ -48,28 +66,37 @@ class TwitchStreamer(Streamer):
 
     @property
     def thumbnail_url(self):
-        return self.api['preview']['large'] + anticache()
+        return self._thumbnail_url
 
     @property
     def service_icon_url(self):
         return 'https://i.imgur.com/miKaDpC.png'
 
+    @property
+    def session_id(self):
+        return self._session_id
+
     @property
     def channel_viewers(self):
-        return self.api['viewers']
+        return self._viewers
 
     @property
     def stream_url(self):
-        return self.api['channel']['url']
+        return self._stream_url or f'https://twitch.tv/{self.channel_name}'
 
     @property
     def avatar_url(self):
-        return self.api.get('logo', None) or self.api['channel']['logo']
+        return self._avatar_url
 
 
 class Twitch(Service):
     """Twitch notifications"""
 
+    capabilities = Capabilities(
+        max_batch_size=100,
+        rate_limit_headers=('Ratelimit-Remaining', 'Ratelimit-Reset'),
+    )
+
     def __init__(self, bot):
         super().__init__(
             bot=bot,
@@ -84,31 +111,19 @@ class Twitch(Service):
     async def __error(self, ctx, error):
         await self._cog__error(ctx, error)
 
-    async def get_online_streamers(self) -> Dict[str, Streamer]:
-
-        online_streamers = {}
-        db = await self.database_streamers()
-
-        TWITCH_MAX_LIMIT = 100
-        streamer_batch = chunks(db, TWITCH_MAX_LIMIT)
-        for i, chunk in enumerate(streamer_batch):
-            params = {
-                'channel': ','.join(chunk),
-                'limit': TWITCH_MAX_LIMIT,
-                'offset': TWITCH_MAX_LIMIT * i,
-            }
-            response = await self.api_request(endpoint='/streams', params=params)
-            if 'streams' not in response:
-                log.error(response)
-                continue
-            for s in response['streams']:
-                service_id, streamer = TwitchStreamer.from_api_response(
-                    api=s,
-                    database=db,
-                )
-                online_streamers[service_id] = streamer
-
-        return online_streamers
+    async def fetch_batch(self, streamers):
+        params = {
+            'channel': ','.join(s.service_id for s in streamers),
+            'limit': self.capabilities.max_batch_size,
+        }
+        response = await self.api_request(endpoint='/streams', params=params)
+        if 'streams' not in response:
+            log.error(response)
+            return None
+        return response['streams']
+
+    def stream_id(self, api):
+        return _get_service_id(api)
 
     @async_cache()
     async def get_streamer_from_API(self, username: str) -> TwitchStreamer:
@@ -122,7 +137,7 @@ class Twitch(Service):
         streamer = response['users'][0]
         return TwitchStreamer.from_api_response(
             api=streamer,
-            database=await self.database_streamers(),
+            database={},
         )[1]
 
     async def api_request(self, *, endpoint, params):
@@ -130,18 +145,14 @@ class Twitch(Service):
             'Accept': 'application/vnd.twitchtv.v5+json',
             'Client-ID': self.api_key,
         }
-        async with self.bot.session.get('https://api.twitch.tv/kraken' + endpoint, headers=headers, params=params) as r:
-            response = await r.json()
+        async with self.poller.limiter:
+            async with self.bot.session.get('https://api.twitch.tv/kraken' + endpoint, headers=headers, params=params) as r:
+                self.poller.limiter.update(r.headers)
+                if r.status >= 500 or r.content_type != 'application/json':
+                    raise errors.UnexpectedApiError(f'HTTP {r.status} ({r.content_type})')
+                response = await r.json()
         return response
 
-    async def validate_username(self, username: str) -> str:
-        if not username:
-            raise errors.InvalidUsernameError(username)
-        if not re.fullmatch(r'^\w{3,24}$', username, re.IGNORECASE):
-            raise errors.InvalidUsernameError(username)
-
-        return username.lower()
-
     def stream_url(self, username: str) -> str:
         return f'https://twitch.tv/{username}'
 
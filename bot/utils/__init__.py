@@ -1,4 +1,13 @@
 from .async_cache import async_cache
 from .database import Database
+from .history import StreamHistory
+from .live_updates import LiveUpdater
+from .outbound import OutboundScheduler
+from .webhooks import Webhooks
 from .errors import InvalidUsernameError, StreamerAlreadyExists, StreamerNotFoundError, UnexpectedApiError, \
-    StreamNotificationBotError, InvalidChannelError, NotSubscribedError
+    StreamNotificationBotError, InvalidChannelError, NotSubscribedError, CommandThrottledError, \
+    InvalidTemplateError
+from .templates import Templates
+from .thumbnails import ThumbnailVersions
+from .throttle import Throttle
+from .tracing import Tracer
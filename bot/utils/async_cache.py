@@ -1,8 +1,17 @@
+import asyncio
 import functools
 from collections import OrderedDict
 
 
 def async_cache(size=256):
+    """Caches the results of a coroutine function.
+
+    The results of the ``size`` most recently used arguments are kept.
+    Concurrent calls with the same arguments share a single pending call
+    instead of each calling the function. Calls that fail or are cancelled
+    are evicted, so that the next call with the same arguments retries.
+    Cancelling a caller doesn't cancel the shared call.
+    """
     cache = OrderedDict()
 
     def decorator(fn):
@@ -14,8 +23,15 @@ def async_cache(size=256):
             except KeyError:
                 if len(cache) >= size:
                     cache.popitem(last=False)
-                cache[key] = await fn(*args, **kwargs)
-            return cache[key]
+                cache[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            future = cache[key]
+            try:
+                return await asyncio.shield(future)
+            except BaseException:
+                failed = future.cancelled() or (future.done() and future.exception() is not None)
+                if failed and cache.get(key) is future:
+                    del cache[key]
+                raise
 
         return memoizer
 
@@ -0,0 +1,179 @@
+"""Streaming export and import of the subscription database.
+
+Exports are gzip-compressed files made of a header followed by frames. Each
+table starts with a ``T`` frame describing it, followed by ``D`` frames with
+chunks of its ``COPY ... TO STDOUT`` CSV output, and ends with an ``E`` frame.
+Rows are never held in memory as a whole, neither when exporting nor when
+importing, so memory use doesn't depend on the size of the tables.
+"""
+
+import gzip
+import json
+import logging
+import struct
+import time
+
+from ..utils import strings
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'SNBX'
+VERSION = 1
+
+TABLES = {
+    'streamers': ['streamer_id', 'service_id', 'service', 'username'],
+    'subscriptions': ['subscriber_id', 'streamer_id'],
+}
+
+# Seconds that each copy and merge may take, since they take a lot longer than the pool's query timeout
+TIMEOUT = 3600
+
+_HEADER = struct.Struct('>4sH')
+_FRAME = struct.Struct('>cI')
+
+
+class BackupError(Exception):
+    pass
+
+
+class Progress:
+    """Tracks and logs how much data went through an export or import"""
+
+    def __init__(self, *, log_every=16 * 1024 * 1024):
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.rows = {}
+        self.log_every = log_every
+        self._next_log = log_every
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def throughput(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def add_bytes(self, count):
+        self.bytes += count
+        if self.bytes >= self._next_log:
+            self._next_log += self.log_every
+            log.info('%s', self)
+
+    def __str__(self):
+        rows = ', '.join(f'{table}: {count} rows' for table, count in self.rows.items())
+        return (f'{self.bytes / 1024 / 1024:.1f} MiB in {self.elapsed:.1f}s '
+                f'({self.throughput / 1024 / 1024:.1f} MiB/s){", " + rows if rows else ""}')
+
+
+def _copy_row_count(status):
+    # asyncpg returns the command status, such as "COPY 42"
+    try:
+        return int(status.split()[-1])
+    except (AttributeError, ValueError, IndexError):
+        return 0
+
+
+def _write_frame(file, kind, payload):
+    file.write(_FRAME.pack(kind, len(payload)))
+    file.write(payload)
+
+
+def _read_frame(file):
+    header = file.read(_FRAME.size)
+    if len(header) != _FRAME.size:
+        raise BackupError('Unexpected end of file')
+    kind, length = _FRAME.unpack(header)
+    payload = file.read(length)
+    if len(payload) != length:
+        raise BackupError('Unexpected end of file')
+    return kind, payload
+
+
+async def export_database(pool, path, *, loop):
+    """Exports the streamers and subscriptions tables into a file
+
+    :param pool: asyncpg pool to export from
+    :param path: Path of the file to write
+    :return: The :class:`Progress` of the export
+    """
+    progress = Progress()
+    run = lambda fn, *args: loop.run_in_executor(None, fn, *args)
+
+    file = await run(gzip.open, path, 'wb')
+    try:
+        await run(file.write, _HEADER.pack(MAGIC, VERSION))
+        async with pool.acquire() as con:
+            async with con.transaction(isolation='repeatable_read', readonly=True):
+                for table, columns in TABLES.items():
+                    header = json.dumps({'table': table, 'columns': columns}).encode()
+                    await run(_write_frame, file, b'T', header)
+
+                    async def output(chunk):
+                        progress.add_bytes(len(chunk))
+                        await run(_write_frame, file, b'D', bytes(chunk))
+
+                    status = await con.copy_from_table(
+                        table, columns=columns, output=output, format='csv', timeout=TIMEOUT)
+                    progress.rows[table] = _copy_row_count(status)
+                    await run(_write_frame, file, b'E', b'')
+    finally:
+        await run(file.close)
+
+    log.info('Exported %s to %s', progress, path)
+    return progress
+
+
+async def import_database(pool, path, *, loop):
+    """Imports a file made by :func:`export_database`.
+
+    The rows are copied into temporary tables and then merged into the real
+    ones, skipping streamers and subscriptions that already exist. Streamer
+    ids are remapped, so importing into a database that already has data works.
+
+    :param pool: asyncpg pool to import into
+    :param path: Path of the file to read
+    :return: The :class:`Progress` of the import
+    """
+    progress = Progress()
+    sql = strings.database_queries
+    run = lambda fn, *args: loop.run_in_executor(None, fn, *args)
+
+    file = await run(gzip.open, path, 'rb')
+    try:
+        magic, version = _HEADER.unpack(await run(file.read, _HEADER.size))
+        if magic != MAGIC:
+            raise BackupError(f'{path} is not a backup file')
+        if version > VERSION:
+            raise BackupError(f'Unsupported backup version {version}')
+
+        async def source():
+            while True:
+                kind, payload = await run(_read_frame, file)
+                if kind == b'E':
+                    return
+                if kind != b'D':
+                    raise BackupError(f'Unexpected frame {kind!r} in table data')
+                progress.add_bytes(len(payload))
+                yield payload
+
+        async with pool.acquire() as con:
+            async with con.transaction():
+                await con.execute(sql['create_import_tables'])
+                for _ in TABLES:
+                    kind, payload = await run(_read_frame, file)
+                    if kind != b'T':
+                        raise BackupError(f'Expected a table frame, got {kind!r}')
+                    header = json.loads(payload)
+                    table = header['table']
+                    if table not in TABLES:
+                        raise BackupError(f'Unknown table {table}')
+                    status = await con.copy_to_table(
+                        f'import_{table}', columns=header['columns'], source=source(), format='csv', timeout=TIMEOUT)
+                    progress.rows[table] = _copy_row_count(status)
+                await con.execute(sql['merge_import_tables'], timeout=TIMEOUT)
+    finally:
+        await run(file.close)
+
+    log.info('Imported %s from %s', progress, path)
+    return progress
@@ -1,5 +1,8 @@
+import asyncio
 import logging
 import pathlib
+import time
+from abc import ABC, abstractmethod
 
 import asyncpg
 
@@ -8,24 +11,208 @@ from ..utils import strings
 
 log = logging.getLogger(__name__)
 
+STREAM_SESSION_COLUMNS = ['service', 'service_id', 'started_at', 'ended_at', 'peak_viewers', 'average_viewers']
 
-class Database:
-    def __init__(self, pool):
+
+class Database(ABC):
+    """Storage backend interface used by the bot.
+
+    Returned records support both key access (``record['streamer_id']``) and
+    tuple unpacking (``for (subscriber_id,) in records``).
+    """
+
+    @staticmethod
+    async def create_database(*, loop, username, password, database, hostname='localhost', port=5432, **kwargs):
+        return await PostgresDatabase.create_database(
+            loop=loop,
+            username=username,
+            password=password,
+            database=database,
+            hostname=hostname,
+            port=port,
+            **kwargs,
+        )
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_subscription(self, *, subscriber_id: int, service: str, username: str, service_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def del_subscription(self, *, subscriber_id: int, service: str, username: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_subscriber(self, *, subscriber_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_streamers_from_service(self, *, service: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_subscribers_from_streamer(self, streamer_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_subscriptions_from_subscriber(self, subscriber_id: int, service: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_webhooks(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_webhook(self, *, channel_id: int, webhook_id: int, webhook_token: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_webhook(self, *, channel_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_templates(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_template(self, *, subscriber_id: int, template: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_template(self, *, subscriber_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_stream_sessions(self, sessions):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_stream_stats(self, *, service: str, username: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rollup_stream_sessions(self, *, before):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def enqueue_notifications(self, notifications):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_notifications(self, *, limit: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_delivery_channels(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_delivery_channel(self, *, subscriber_id: int, channel_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_delivery_channel(self, *, subscriber_id: int):
+        raise NotImplementedError
+
+
+class PostgresDatabase(Database):
+    """Postgres storage backend.
+
+    If a replica pool is given, the heavy read-only queries go to it, except
+    for a subscriber's own subscriptions right after they changed them, which
+    are read from the primary so that they see their own changes. The replica
+    is health checked periodically, and reads fall back to the primary while
+    it's unhealthy. Every query times out after ``timeout`` seconds.
+    """
+
+    # Errors that mean that the replica is unavailable rather than that the query is wrong
+    REPLICA_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError)
+
+    def __init__(self, pool, replica_pool=None, *, loop=None, read_your_writes_window=10, health_check_period=10):
         self.pool = pool
+        self.replica_pool = replica_pool
+        self.replica_healthy = replica_pool is not None
+        self.read_your_writes_window = read_your_writes_window
+        self.health_check_period = health_check_period
+        self.recent_writes = {}
         self.sql = strings.database_queries
+        self._health_check = None
+        if replica_pool is not None:
+            self._health_check = (loop or asyncio.get_event_loop()).create_task(self._check_replica())
 
     @staticmethod
-    async def create_database(*, loop, username, password, database, hostname='localhost', port=5432):
+    async def create_database(*, loop, username, password, database, hostname='localhost', port=5432,
+                              replica_hostname=None, replica_port=5432, timeout=10):
         dsn = "postgres://{}:{}@{}:{}/{}".format(username, password, hostname, port, database)
-        pool = await asyncpg.create_pool(dsn, loop=loop)
+        pool = await asyncpg.create_pool(dsn, loop=loop, command_timeout=timeout)
         sql = pathlib.Path('tables.sql').read_text()
         await pool.execute(sql)
 
-        return Database(pool)
+        replica_pool = None
+        if replica_hostname:
+            dsn = "postgres://{}:{}@{}:{}/{}".format(username, password, replica_hostname, replica_port, database)
+            replica_pool = await asyncpg.create_pool(dsn, loop=loop, command_timeout=timeout)
+
+        return PostgresDatabase(pool, replica_pool, loop=loop)
 
     async def close(self):
+        if self._health_check:
+            self._health_check.cancel()
+        if self.replica_pool:
+            await self.replica_pool.close()
         await self.pool.close()
 
+    async def _check_replica(self):
+        while True:
+            try:
+                await self.replica_pool.fetchval('SELECT 1', timeout=self.health_check_period / 2)
+                healthy = True
+            except self.REPLICA_ERRORS as e:
+                log.warning('Replica health check failed: %s', e)
+                healthy = False
+            if healthy != self.replica_healthy:
+                log.warning('Replica is now %s', 'healthy' if healthy else 'unhealthy, reading from the primary')
+            self.replica_healthy = healthy
+            await asyncio.sleep(self.health_check_period)
+
+    def _wrote(self, subscriber_id):
+        now = time.monotonic()
+        self.recent_writes[subscriber_id] = now
+        if len(self.recent_writes) > 1000:
+            self.recent_writes = {
+                k: t for k, t in self.recent_writes.items() if now - t < self.read_your_writes_window
+            }
+
+    @property
+    def read_pool(self):
+        """The pool that read-only work like exports should use"""
+        return self._read_pool()
+
+    def _read_pool(self, subscriber_id=None):
+        if not self.replica_healthy:
+            return self.pool
+        wrote_at = self.recent_writes.get(subscriber_id)
+        if wrote_at is not None and time.monotonic() - wrote_at < self.read_your_writes_window:
+            return self.pool
+        return self.replica_pool
+
+    async def _read(self, method, query, *args, subscriber_id=None):
+        """Runs a read-only query on the replica if possible, otherwise on the primary"""
+        pool = self._read_pool(subscriber_id)
+        try:
+            async with pool.acquire() as con:
+                return await getattr(con, method)(query, *args)
+        except self.REPLICA_ERRORS as e:
+            if pool is self.pool:
+                raise
+            log.warning('Replica query failed, falling back to the primary: %s', e)
+            self.replica_healthy = False
+        async with self.pool.acquire() as con:
+            return await getattr(con, method)(query, *args)
+
     async def add_subscription(self, *, subscriber_id: int, service: str, username: str, service_id: str):
         """Adds a new subscription
 
@@ -44,6 +231,7 @@ class Database:
                     await con.execute(self.sql['insert_subscriptions'], subscriber_id, streamer_id)
                 except asyncpg.UniqueViolationError as e:
                     raise StreamerAlreadyExists from e
+        self._wrote(subscriber_id)
 
     async def del_subscription(self, *, subscriber_id: int, service: str, username: str):
         """Deletes a subscription
@@ -57,6 +245,7 @@ class Database:
         async with self.pool.acquire() as con:
             async with con.transaction():
                 await con.execute(self.sql['del_subscription'], service, username, subscriber_id)
+        self._wrote(subscriber_id)
 
     async def delete_subscriber(self, *, subscriber_id: int):
         """Deletes all subscriptions from a subscriber
@@ -65,6 +254,7 @@ class Database:
         """
         async with self.pool.acquire() as con:
             await con.execute(self.sql['delete_subscriber'], subscriber_id)
+        self._wrote(subscriber_id)
 
     async def get_all_streamers_from_service(self, *, service: str):
         """Returns all streamers related to a service
@@ -72,8 +262,7 @@ class Database:
         :param service: The service to get the streamers from
         :return: The streamers related to the service
         """
-        async with self.pool.acquire() as con:
-            return await con.fetch(self.sql['get_all_streamers_from_service'], service)
+        return await self._read('fetch', self.sql['get_all_streamers_from_service'], service)
 
     async def get_subscribers_from_streamer(self, streamer_id: str):
         """Returns all the subscribers that are subscribed to a streamer
@@ -81,8 +270,7 @@ class Database:
         :param streamer_id: ID of the streamer
         :return: Iterable of channel IDs of the streamer's subscribers
         """
-        async with self.pool.acquire() as con:
-            return await con.fetch(self.sql['get_subscribers_from_streamer'], streamer_id)
+        return await self._read('fetch', self.sql['get_subscribers_from_streamer'], streamer_id)
 
     async def get_subscriptions_from_subscriber(self, subscriber_id: int, service: str):
         """Returns all the streamers that the subscriber is subscribed to
@@ -91,5 +279,129 @@ class Database:
         :param service: The service that the subscriber is referring to
         :return: Iterable of (username, service) of all the streamers that the subscriber is currently subscribed to
         """
+        return await self._read('fetch', self.sql['get_subscriptions_from_subscriber'], subscriber_id, service,
+                                subscriber_id=subscriber_id)
+
+    async def get_all_webhooks(self):
+        """Returns all the webhooks used for delivering notifications
+
+        :return: Iterable of (channel_id, webhook_id, webhook_token)
+        """
+        async with self.pool.acquire() as con:
+            return await con.fetch(self.sql['get_all_webhooks'])
+
+    async def add_webhook(self, *, channel_id: int, webhook_id: int, webhook_token: str):
+        """Sets the webhook used for delivering notifications to a channel
+
+        :param channel_id: ID of the channel
+        :param webhook_id: ID of the webhook
+        :param webhook_token: Token of the webhook
+        """
+        async with self.pool.acquire() as con:
+            await con.execute(self.sql['add_webhook'], channel_id, webhook_id, webhook_token)
+
+    async def delete_webhook(self, *, channel_id: int):
+        """Stops delivering notifications to a channel through a webhook
+
+        :param channel_id: ID of the channel
+        """
+        async with self.pool.acquire() as con:
+            await con.execute(self.sql['delete_webhook'], channel_id)
+
+    async def get_all_templates(self):
+        """Returns all the notification templates
+
+        :return: Iterable of (subscriber_id, template)
+        """
+        async with self.pool.acquire() as con:
+            return await con.fetch(self.sql['get_all_templates'])
+
+    async def set_template(self, *, subscriber_id: int, template: str):
+        """Sets the notification template of a subscriber
+
+        :param subscriber_id: Subscriber id
+        :param template: The template's source
+        """
+        async with self.pool.acquire() as con:
+            await con.execute(self.sql['set_template'], subscriber_id, template)
+
+    async def delete_template(self, *, subscriber_id: int):
+        """Deletes the notification template of a subscriber
+
+        :param subscriber_id: Subscriber id
+        """
+        async with self.pool.acquire() as con:
+            await con.execute(self.sql['delete_template'], subscriber_id)
+
+    async def add_stream_sessions(self, sessions):
+        """Adds finished stream sessions to the stream history
+
+        :param sessions: Iterable of (service, service_id, started_at, ended_at, peak_viewers, average_viewers)
+        """
+        async with self.pool.acquire() as con:
+            await con.copy_records_to_table('stream_sessions', records=sessions, columns=STREAM_SESSION_COLUMNS)
+
+    async def get_stream_stats(self, *, service: str, username: str):
+        """Returns the stream history statistics of a streamer
+
+        :param service: Streaming service of the streamer
+        :param username: Username of the streamer
+        :return: (sessions, duration_seconds, viewer_seconds, peak_viewers), or None if the streamer isn't tracked
+        """
+        streamer = await self._read('fetchrow', self.sql['get_streamer_by_username'], service, username)
+        if not streamer:
+            return None
+        return await self._read('fetchrow', self.sql['get_stream_stats'], service, streamer['service_id'])
+
+    async def rollup_stream_sessions(self, *, before):
+        """Rolls up the stream sessions that ended before a date into daily statistics
+
+        :param before: The sessions that ended before this datetime are rolled up
+        """
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute(self.sql['rollup_stream_sessions'], before)
+
+    async def enqueue_notifications(self, notifications):
+        """Queues notifications for the delivery workers
+
+        :param notifications: Iterable of (subscriber_id, key, payload)
+        """
+        async with self.pool.acquire() as con:
+            await con.executemany(self.sql['enqueue_notification'], notifications)
+
+    async def claim_notifications(self, *, limit: int):
+        """Removes the oldest queued notifications from the queue and returns them.
+
+        Notifications claimed by a worker aren't seen by the other workers.
+
+        :param limit: Maximum number of notifications to claim
+        :return: Iterable of (subscriber_id, key, payload)
+        """
+        async with self.pool.acquire() as con:
+            return await con.fetch(self.sql['claim_notifications'], limit)
+
+    async def get_all_delivery_channels(self):
+        """Returns the channels that the delivery workers send each subscriber's notifications to
+
+        :return: Iterable of (subscriber_id, channel_id)
+        """
+        async with self.pool.acquire() as con:
+            return await con.fetch(self.sql['get_all_delivery_channels'])
+
+    async def set_delivery_channel(self, *, subscriber_id: int, channel_id: int):
+        """Sets the channel that a subscriber's notifications are sent to
+
+        :param subscriber_id: Subscriber id
+        :param channel_id: ID of the text channel or of the subscriber's DM channel
+        """
+        async with self.pool.acquire() as con:
+            await con.execute(self.sql['set_delivery_channel'], subscriber_id, channel_id)
+
+    async def delete_delivery_channel(self, *, subscriber_id: int):
+        """Forgets the channel that a subscriber's notifications are sent to
+
+        :param subscriber_id: Subscriber id
+        """
         async with self.pool.acquire() as con:
-            return await con.fetch(self.sql['get_subscriptions_from_subscriber'], subscriber_id, service)
+            await con.execute(self.sql['delete_delivery_channel'], subscriber_id)
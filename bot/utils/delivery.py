@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+from typing import NamedTuple, Optional
+
+import aiohttp
+import discord
+from discord.http import HTTPClient, Route
+
+from . import outbound
+from .outbound import OutboundScheduler
+from .webhooks import Webhooks, message_count
+
+log = logging.getLogger(__name__)
+
+
+def encode_notification(embeds, content=None) -> str:
+    """Serializes a rendered notification for the notification queue"""
+    return json.dumps({'embeds': [embed.to_dict() for embed in embeds], 'content': content})
+
+
+def decode_notification(payload: str):
+    """Deserializes a notification from the notification queue
+
+    :return: (embeds, content)
+    """
+    data = json.loads(payload)
+    return [discord.Embed.from_data(embed) for embed in data['embeds']], data['content']
+
+
+class WorkerUser(NamedTuple):
+    """The few fields of the bot's user that webhook messages need"""
+    id: int
+    name: str
+    avatar_url: str
+
+    @classmethod
+    def from_data(cls, data):
+        user_id = int(data['id'])
+        if data.get('avatar'):
+            avatar_url = f'https://cdn.discordapp.com/avatars/{user_id}/{data["avatar"]}.png'
+        else:
+            avatar_url = f'https://cdn.discordapp.com/embed/avatars/{int(data["discriminator"]) % 5}.png'
+        return cls(id=user_id, name=data['username'], avatar_url=avatar_url)
+
+
+class DeliveryWorker:
+    """Delivers queued notifications over REST, without a gateway connection.
+
+    The bot queues rendered notifications in the database instead of sending
+    them when it runs with delivery workers. Any number of workers claim them
+    from the queue, so delivery throughput scales with processes instead of
+    with gateway sessions.
+
+    Without the gateway cache, a subscriber id is resolved into the channel to
+    send to over REST: it's either a text channel, or a user whose DM channel
+    is opened. Resolved channels are stored in the database, so that they're
+    shared by the workers and survive restarts.
+
+    Notifications are removed from the queue when they're claimed, so the ones
+    claimed by a worker that crashes are lost rather than delivered twice.
+
+    The bot and the workers share the global rate limit of the bot's token, so
+    each of them gets an equal share of it, given the number of ``workers``.
+    """
+
+    def __init__(self, database, *, loop, workers=1, batch_size=100, poll_interval=1.0):
+        self.database = database
+        self.loop = loop
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.http = HTTPClient(loop=loop)
+        self.session = aiohttp.ClientSession(loop=loop)
+        self.outbound = OutboundScheduler(rate=outbound.shared_rate(workers + 1))
+        self.webhooks = Webhooks(self)
+        self.user = None
+        self._channels = None
+        self._lock = asyncio.Lock()
+
+    async def close(self):
+        await self.http.close()
+        await self.session.close()
+
+    async def run(self, token: str):
+        """Logs in and delivers queued notifications until cancelled"""
+        self.user = WorkerUser.from_data(await self.http.static_login(token, bot=True))
+        log.info('Delivery worker logged in as %s (%s)', self.user.name, self.user.id)
+
+        while True:
+            try:
+                notifications = await self.database.claim_notifications(limit=self.batch_size)
+            except Exception as e:  # noqa
+                log.exception('run: Failed to claim notifications: %s', e)
+                notifications = None
+
+            if not notifications:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            results = await asyncio.gather(*(self.deliver(*notification) for notification in notifications))
+            log.info('Delivered %s notification(s) (%s failed)', sum(results), len(results) - sum(results))
+
+    async def _cache(self):
+        if self._channels is None:
+            async with self._lock:
+                if self._channels is None:
+                    self._channels = dict(await self.database.get_all_delivery_channels())
+        return self._channels
+
+    async def resolve(self, subscriber_id: int) -> Optional[int]:
+        """Returns the ID of the channel to send the subscriber's notifications to,
+        or None if the subscriber doesn't exist anymore"""
+        channels = await self._cache()
+        try:
+            return channels[subscriber_id]
+        except KeyError:
+            pass
+
+        await self.outbound.acquire(outbound.MAINTENANCE)
+        try:
+            await self.http.request(Route('GET', '/channels/{channel_id}', channel_id=subscriber_id))
+            channel_id = subscriber_id
+        except discord.Forbidden:
+            # a channel that the bot can't see anymore, sending to it will tell
+            channel_id = subscriber_id
+        except discord.NotFound:
+            await self.outbound.acquire(outbound.MAINTENANCE)
+            try:
+                channel_id = int((await self.http.start_private_message(subscriber_id))['id'])
+            except (discord.NotFound, discord.Forbidden):
+                return None
+
+        await self.database.set_delivery_channel(subscriber_id=subscriber_id, channel_id=channel_id)
+        channels[subscriber_id] = channel_id
+        return channel_id
+
+    async def forget(self, subscriber_id: int):
+        if (await self._cache()).pop(subscriber_id, None):
+            await self.database.delete_delivery_channel(subscriber_id=subscriber_id)
+
+    async def deliver(self, subscriber_id: int, key: str, payload: str) -> bool:
+        """Delivers a single queued notification
+
+        :return: Whether it was delivered
+        """
+        embeds, content = decode_notification(payload)
+        try:
+            webhook = await self.webhooks.get(subscriber_id)
+            cost = message_count(len(embeds)) if webhook else len(embeds)
+            await self.outbound.acquire(outbound.NOTIFICATION, key=key, cost=cost)
+            remaining = await self.webhooks.send(subscriber_id, embeds, content=content)
+            if not remaining:
+                return True
+            if webhook:
+                # the webhook is gone, so the messages sent instead weren't accounted for
+                await self.outbound.acquire(outbound.NOTIFICATION, key=key, cost=len(remaining))
+            if len(remaining) < len(embeds):
+                content = None
+
+            channel_id = await self.resolve(subscriber_id)
+            if channel_id is None:
+                log.info('Deleting subscriber %s from database...', subscriber_id)
+                await self.database.delete_subscriber(subscriber_id=subscriber_id)
+                return False
+
+            for embed in remaining:
+                await self.http.send_message(channel_id, content, embed=embed.to_dict())
+                content = None
+            return True
+        except discord.NotFound as e:
+            # the cached channel is gone, it's resolved again next time
+            log.warning('deliver: Channel of subscriber %s not found: %s', subscriber_id, e)
+            await self.forget(subscriber_id)
+        except discord.Forbidden as e:
+            log.error('deliver: No permissions to send the message to %s: %s', subscriber_id, e)
+        except discord.HTTPException as e:
+            log.error('deliver: Sending the message to %s failed: %s', subscriber_id, e)
+        except Exception as e:  # noqa
+            log.exception('deliver: General exception: %s', e)
+        return False
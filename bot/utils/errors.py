@@ -24,3 +24,13 @@ class InvalidChannelError(StreamNotificationBotError):
 
 class UnexpectedApiError(StreamNotificationBotError):
     pass
+
+
+class CommandThrottledError(StreamNotificationBotError):
+    def __init__(self, retry_after):
+        super().__init__(f'Try again in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class InvalidTemplateError(StreamNotificationBotError):
+    pass
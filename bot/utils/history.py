@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class _Session:
+    __slots__ = ('started_at', 'last_seen', 'peak_viewers', 'total_viewers', 'samples')
+
+    def __init__(self, now):
+        self.started_at = now
+        self.last_seen = now
+        self.peak_viewers = 0
+        self.total_viewers = 0
+        self.samples = 0
+
+    def observe(self, now, viewers):
+        self.last_seen = now
+        self.peak_viewers = max(self.peak_viewers, viewers)
+        self.total_viewers += viewers
+        self.samples += 1
+
+
+class StreamHistory:
+    """Write-behind recorder of stream sessions.
+
+    Viewer counts are aggregated in memory while a stream is live, and each
+    session becomes a single row once it ends. Finished sessions are buffered
+    and written in bulk every ``flush_interval`` seconds. When the buffer holds
+    ``max_buffer`` sessions, recording a new one waits for a flush, and if the
+    database can't keep up the oldest sessions are dropped.
+
+    Sessions older than ``retention`` are rolled up into daily statistics on
+    startup and then once a day, so that the raw history stays bounded even
+    if the bot restarts more often than that.
+    """
+
+    def __init__(self, *, loop, database, flush_interval=60, max_buffer=5000, retention=datetime.timedelta(days=90)):
+        self.database = database
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention = retention
+        self.active = {}
+        self.buffer = []
+        self.dropped = 0
+        self._lock = asyncio.Lock()
+        self._tasks = [
+            loop.create_task(self._flush_periodically()),
+            loop.create_task(self._rollup_periodically()),
+        ]
+
+    def observe(self, service: str, service_id: str, viewers):
+        """Records a viewer count sample of a live stream"""
+        try:
+            viewers = int(viewers)
+        except (TypeError, ValueError):
+            viewers = 0
+        now = datetime.datetime.utcnow()
+        key = (service, service_id)
+        session = self.active.get(key)
+        if session is None:
+            session = self.active[key] = _Session(now)
+        session.observe(now, viewers)
+
+    async def end(self, service: str, service_id: str, *, ended_at=None):
+        """Marks the stream as ended and buffers its session for writing
+
+        :param ended_at: When the session ended, by default when the stream was last seen
+        """
+        session = self.active.pop((service, service_id), None)
+        if session is None or not session.samples:
+            return
+        if len(self.buffer) >= self.max_buffer:
+            await self.flush()
+        if len(self.buffer) >= self.max_buffer:
+            self.buffer.pop(0)
+            self.dropped += 1
+            log.warning('Stream history buffer is full, dropped %s sessions so far', self.dropped)
+        self.buffer.append((
+            service,
+            service_id,
+            session.started_at,
+            ended_at or session.last_seen,
+            session.peak_viewers,
+            session.total_viewers // session.samples,
+        ))
+
+    async def flush(self):
+        async with self._lock:
+            if not self.buffer:
+                return
+            sessions, self.buffer = self.buffer, []
+            try:
+                await self.database.add_stream_sessions(sessions)
+                log.debug('Wrote %s stream sessions', len(sessions))
+            except Exception as e:  # noqa
+                log.exception('Failed to write %s stream sessions: %s', len(sessions), e)
+                self.buffer = (sessions + self.buffer)[-self.max_buffer:]
+
+    async def close(self):
+        """Ends the sessions of the streams that are still live and writes every buffered session"""
+        for task in self._tasks:
+            task.cancel()
+        now = datetime.datetime.utcnow()
+        for service, service_id in list(self.active):
+            await self.end(service, service_id, ended_at=now)
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _rollup_periodically(self):
+        while True:
+            try:
+                await self.database.rollup_stream_sessions(before=datetime.datetime.utcnow() - self.retention)
+                log.info('Rolled up stream sessions older than %s', self.retention)
+            except Exception as e:  # noqa
+                log.exception('Failed to roll up stream sessions: %s', e)
+            await asyncio.sleep(24 * 60 * 60)
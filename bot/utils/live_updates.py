@@ -0,0 +1,178 @@
+import datetime
+import logging
+import time
+
+import discord
+
+from . import outbound
+
+log = logging.getLogger(__name__)
+
+
+def format_uptime(delta: datetime.timedelta) -> str:
+    minutes = int(delta.total_seconds()) // 60
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h {minutes}m' if hours else f'{minutes}m'
+
+
+class _TrackedMessage:
+    __slots__ = ('message', 'last_embed')
+
+    def __init__(self, message, embed):
+        self.message = message
+        self.last_embed = embed.to_dict()
+
+    @property
+    def activity(self):
+        """When the message's channel was last active, according to its last message"""
+        last_message_id = getattr(self.message.channel, 'last_message_id', None)
+        return discord.utils.snowflake_time(last_message_id) if last_message_id else datetime.datetime.min
+
+
+class _Session:
+    __slots__ = ('streamer', 'started_at', 'thumbnail_version', 'messages', 'ended', 'final_uptime')
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+        if streamer.started_at:
+            self.started_at = datetime.datetime.utcfromtimestamp(streamer.started_at)
+        else:
+            self.started_at = datetime.datetime.utcnow()
+        self.thumbnail_version = streamer.thumbnail_version
+        self.messages = []
+        self.ended = False
+        self.final_uptime = None
+
+
+class LiveUpdater:
+    """Keeps sent notifications up to date with the stream's viewers and
+    uptime, and marks them as offline once the stream ends.
+
+    Edits are limited by a global budget of ``edits_per_minute``. When there
+    are more messages to edit than the budget allows, the messages in the most
+    recently active channels go first, and offline edits go before all others.
+    Messages whose embed wouldn't change aren't edited.
+
+    Edits run in the background through the maintenance lane of the outbound
+    scheduler, so that they never hold up the notifications.
+
+    Ended sessions are kept apart from the live ones until their offline edits
+    are done, so that a new session of the same streamer doesn't replace them.
+    """
+
+    def __init__(self, *, bot, edits_per_minute=60, max_messages_per_session=500):
+        self.bot = bot
+        self.edits_per_minute = edits_per_minute
+        self.max_messages_per_session = max_messages_per_session
+        self.tokens = edits_per_minute
+        self.updated = time.monotonic()
+        self.sessions = {}
+        self.ended = []
+        self._tasks = {}
+
+    def track(self, streamer, message, embed):
+        """Starts keeping a sent notification message up to date"""
+        key = (streamer.service_name, streamer.service_id)
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = _Session(streamer)
+        if len(session.messages) < self.max_messages_per_session:
+            session.messages.append(_TrackedMessage(message, embed))
+
+    def update(self, service_name: str, live_streamers, ended):
+        """Starts editing the tracked messages of a service in the background.
+
+        If the previous edits of the service are still running, only the
+        ended streams are recorded, and they're edited on a later update.
+
+        :param live_streamers: The service's live streamers, keyed by service id
+        :param ended: The service ids of the streamers whose stream ended
+        """
+        for service_id in ended:
+            self.end(service_name, service_id)
+
+        task = self._tasks.get(service_name)
+        if task is None or task.done():
+            self._tasks[service_name] = self.bot.loop.create_task(self._edit(service_name, live_streamers))
+
+    def end(self, service_name: str, service_id: str):
+        """Marks a stream as ended, so that its messages are edited as offline"""
+        session = self.sessions.pop((service_name, service_id), None)
+        if session:
+            session.ended = True
+            session.final_uptime = self._uptime(session)
+            self.ended.append(session)
+
+    def close(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def _edit(self, service_name, live_streamers):
+        try:
+            await self._edit_messages(service_name, live_streamers)
+        except Exception as e:  # noqa
+            log.exception('_edit: %s', e)
+
+    async def _edit_messages(self, service_name, live_streamers):
+        edits = []
+        finished = {}
+        for session in self.ended:
+            if session.streamer.service_name != service_name:
+                continue
+            embed = session.streamer.create_offline_embed(session.final_uptime)
+            data = finished[session] = embed.to_dict()
+            edits.extend((True, tracked.activity, tracked, embed, data)
+                         for tracked in session.messages if tracked.last_embed != data)
+
+        for (service, service_id), session in self.sessions.items():
+            if service != service_name:
+                continue
+            streamer = live_streamers.get(service_id)
+            if streamer is None:
+                continue
+            streamer.thumbnail_version = session.thumbnail_version
+            session.streamer = streamer
+            embed = streamer.create_notification_embed(uptime=self._uptime(session))
+            data = embed.to_dict()
+            edits.extend((False, tracked.activity, tracked, embed, data)
+                         for tracked in session.messages if tracked.last_embed != data)
+
+        # offline edits first, then the most recently active channels
+        edits.sort(key=lambda edit: (edit[0], edit[1]), reverse=True)
+        self._refill()
+        for _, _, tracked, embed, data in edits[:int(self.tokens)]:
+            self.tokens -= 1
+            try:
+                await self.bot.outbound.acquire(outbound.MAINTENANCE)
+                await tracked.message.edit(embed=embed)
+                tracked.last_embed = data
+            except (discord.NotFound, discord.Forbidden):
+                # the message was deleted or can't be edited anymore
+                tracked.last_embed = None
+            except discord.HTTPException as e:
+                log.warning('Failed to edit notification %s: %s', tracked.message.id, e)
+
+        # forget the messages that were deleted, and the sessions with nothing left to edit
+        for key, session in list(self.sessions.items()):
+            if key[0] != service_name:
+                continue
+            session.messages = [m for m in session.messages if m.last_embed is not None]
+            if not session.messages:
+                del self.sessions[key]
+        ended = []
+        for session in self.ended:
+            if session in finished:
+                session.messages = [m for m in session.messages if m.last_embed is not None]
+                if all(m.last_embed == finished[session] for m in session.messages):
+                    continue
+            ended.append(session)
+        self.ended = ended
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.edits_per_minute, self.tokens + (now - self.updated) * self.edits_per_minute / 60)
+        self.updated = now
+
+    @staticmethod
+    def _uptime(session):
+        return format_uptime(datetime.datetime.utcnow() - session.started_at)
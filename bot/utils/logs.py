@@ -0,0 +1,64 @@
+import copy
+import datetime
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line
+
+    Records come from :class:`DroppingQueueHandler`, which has already turned
+    their exception into ``exc_text``.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full.
+
+    The number of dropped records is reported with the next record that fits
+    in the queue.
+    """
+
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Makes the record picklable and thread safe, keeping the traceback in
+        ``exc_text`` instead of appending it to the message"""
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info) if self.formatter else \
+                logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            dropped = self.dropped
+            warning = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0, 'Dropped %s log records', (dropped,), None)
+            try:
+                self.queue.put_nowait(warning)
+                self.dropped -= dropped
+            except queue.Full:
+                pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
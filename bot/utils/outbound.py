@@ -0,0 +1,99 @@
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+NOTIFICATION = 1
+MAINTENANCE = 2
+
+# Requests per second allowed by Discord's global rate limit, which is shared by every process using the bot's token
+GLOBAL_RATE = 45
+
+
+def shared_rate(processes: int) -> float:
+    """Returns each process' share of the global rate limit, when the given
+    number of processes send requests with the same token"""
+    return GLOBAL_RATE / max(processes, 1)
+
+
+class OutboundScheduler:
+    """Schedules outbound Discord requests against the global rate limit.
+
+    Every request takes tokens from a single bucket refilled at ``rate``
+    tokens per second. When the bucket is empty, requests wait in priority
+    lanes: interactive replies go first, then notifications, then cleanup and
+    maintenance. Within a lane, requests are grouped by key and the keys are
+    served round-robin, so that one streamer with a huge number of
+    subscribers doesn't starve the notifications of everyone else.
+
+    Processes that share the bot's token, such as delivery workers, must split
+    the global rate between them with :func:`shared_rate`.
+    """
+
+    def __init__(self, *, rate=GLOBAL_RATE):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lanes = {priority: collections.OrderedDict() for priority in (INTERACTIVE, NOTIFICATION, MAINTENANCE)}
+        self.waiting = 0
+        self._dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority=NOTIFICATION, *, key=None, cost=1):
+        """Waits until a request of the given priority can be sent
+
+        :param priority: One of INTERACTIVE, NOTIFICATION or MAINTENANCE
+        :param key: Requests with different keys in the same lane are served round-robin
+        :param cost: How many requests are about to be sent
+        """
+        self._refill()
+        if not self.waiting and self.tokens >= cost:
+            self.tokens -= cost
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        self.lanes[priority].setdefault(key, collections.deque()).append((future, cost))
+        self.waiting += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await future
+
+    def _next(self):
+        for lane in self.lanes.values():
+            while lane:
+                key, queue = next(iter(lane.items()))
+                future, cost = queue[0]
+                if future.cancelled():
+                    queue.popleft()
+                    self.waiting -= 1
+                    if not queue:
+                        del lane[key]
+                    continue
+                return lane, key, queue, future, cost
+        return None
+
+    async def _dispatch(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            lane, key, queue, future, cost = entry
+            self._refill()
+            if self.tokens < min(cost, self.rate):
+                await asyncio.sleep((min(cost, self.rate) - self.tokens) / self.rate)
+                continue
+            self.tokens -= cost
+            queue.popleft()
+            self.waiting -= 1
+            # round-robin: the key goes to the back of its lane
+            del lane[key]
+            if queue:
+                lane[key] = queue
+            future.set_result(None)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import pathlib
+import sqlite3
+
+import aiosqlite
+
+from .database import Database
+from .errors import StreamerAlreadyExists
+from ..utils import strings
+
+log = logging.getLogger(__name__)
+
+
+class SQLiteDatabase(Database):
+    """SQLite storage backend for small installs and local testing.
+
+    All queries go through a single connection in WAL mode. Writes are
+    committed in batches: either once ``batch_size`` writes are pending or
+    every ``flush_interval`` seconds, whichever comes first. Since there's only
+    one connection, uncommitted writes are still visible to subsequent reads.
+
+    Pass ``':memory:'`` as the path for a throwaway in-memory database.
+    """
+
+    def __init__(self, connection, *, loop, batch_size=100, flush_interval=1.0):
+        self.connection = connection
+        self.sql = strings.sqlite_queries
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending_writes = 0
+        self._flush_task = loop.create_task(self._flush_periodically())
+
+    @staticmethod
+    async def create_database(*, loop, path, **kwargs):
+        connection = await aiosqlite.connect(path)
+        connection.row_factory = sqlite3.Row
+        sql = pathlib.Path('tables_sqlite.sql').read_text()
+        await connection.executescript(sql)
+        await connection.commit()
+
+        return SQLiteDatabase(connection, loop=loop, **kwargs)
+
+    async def close(self):
+        self._flush_task.cancel()
+        await self.flush()
+        await self.connection.close()
+
+    async def flush(self):
+        """Commits all pending writes"""
+        if self.pending_writes:
+            log.debug('Committing %s pending writes', self.pending_writes)
+            self.pending_writes = 0
+            await self.connection.commit()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:  # noqa
+                log.exception('_flush_periodically: %s', e)
+
+    async def _write(self, query, *args):
+        await self.connection.execute(query, args)
+        self.pending_writes += 1
+        if self.pending_writes >= self.batch_size:
+            await self.flush()
+
+    async def _fetch(self, query, *args):
+        async with self.connection.execute(query, args) as cursor:
+            return await cursor.fetchall()
+
+    async def add_subscription(self, *, subscriber_id: int, service: str, username: str, service_id: str):
+        await self._write(self.sql['insert_streamers'], username, service, service_id)
+        (record,) = await self._fetch(self.sql['get_streamer_id'], username, service)
+        try:
+            await self._write(self.sql['insert_subscriptions'], subscriber_id, record['streamer_id'])
+        except sqlite3.IntegrityError as e:
+            raise StreamerAlreadyExists from e
+
+    async def del_subscription(self, *, subscriber_id: int, service: str, username: str):
+        await self._write(self.sql['del_subscription'], service, username, subscriber_id)
+
+    async def delete_subscriber(self, *, subscriber_id: int):
+        await self._write(self.sql['delete_subscriber'], subscriber_id)
+
+    async def get_all_streamers_from_service(self, *, service: str):
+        return await self._fetch(self.sql['get_all_streamers_from_service'], service)
+
+    async def get_subscribers_from_streamer(self, streamer_id: str):
+        return await self._fetch(self.sql['get_subscribers_from_streamer'], streamer_id)
+
+    async def get_subscriptions_from_subscriber(self, subscriber_id: int, service: str):
+        return await self._fetch(self.sql['get_subscriptions_from_subscriber'], subscriber_id, service)
+
+    async def get_all_webhooks(self):
+        return await self._fetch(self.sql['get_all_webhooks'])
+
+    async def add_webhook(self, *, channel_id: int, webhook_id: int, webhook_token: str):
+        await self._write(self.sql['add_webhook'], channel_id, webhook_id, webhook_token)
+
+    async def delete_webhook(self, *, channel_id: int):
+        await self._write(self.sql['delete_webhook'], channel_id)
+
+    async def get_all_templates(self):
+        return await self._fetch(self.sql['get_all_templates'])
+
+    async def set_template(self, *, subscriber_id: int, template: str):
+        await self._write(self.sql['set_template'], subscriber_id, template)
+
+    async def delete_template(self, *, subscriber_id: int):
+        await self._write(self.sql['delete_template'], subscriber_id)
+
+    async def add_stream_sessions(self, sessions):
+        await self.connection.executemany(self.sql['insert_stream_sessions'], sessions)
+        self.pending_writes += 1
+        await self.flush()
+
+    async def get_stream_stats(self, *, service: str, username: str):
+        streamers = await self._fetch(self.sql['get_streamer_by_username'], service, username)
+        if not streamers:
+            return None
+        (stats,) = await self._fetch(self.sql['get_stream_stats'], service, streamers[0]['service_id'])
+        return stats
+
+    async def rollup_stream_sessions(self, *, before):
+        await self._write(self.sql['rollup_stream_sessions'], before)
+        await self._write(self.sql['delete_old_stream_sessions'], before)
+        await self.flush()
+
+    async def enqueue_notifications(self, notifications):
+        await self.connection.executemany(self.sql['enqueue_notification'], notifications)
+        self.pending_writes += 1
+        await self.flush()
+
+    async def claim_notifications(self, *, limit: int):
+        # requires SQLite 3.35 for DELETE ... RETURNING
+        notifications = await self._fetch(self.sql['claim_notifications'], limit)
+        self.pending_writes += 1
+        await self.flush()
+        return notifications
+
+    async def get_all_delivery_channels(self):
+        return await self._fetch(self.sql['get_all_delivery_channels'])
+
+    async def set_delivery_channel(self, *, subscriber_id: int, channel_id: int):
+        await self._write(self.sql['set_delivery_channel'], subscriber_id, channel_id)
+
+    async def delete_delivery_channel(self, *, subscriber_id: int):
+        await self._write(self.sql['delete_delivery_channel'], subscriber_id)
@@ -1,9 +1,13 @@
-import pytoml
+try:
+    import tomllib as _toml
+except ImportError:
+    import pytoml as _toml
 
-with open('strings.toml') as f:
-    _strings = pytoml.load(f)
+with open('strings.toml', 'rb') as f:
+    _strings = _toml.load(f)
 
 database_queries = _strings['database']
+sqlite_queries = _strings['sqlite']
 
 help_strings = _strings['help_strings']
 add_command_help = help_strings['add_command_help']
@@ -11,13 +15,15 @@ del_command_help = help_strings['del_command_help']
 list_command_help = help_strings['list_command_help']
 enable_command_help = help_strings['enable_command_help']
 disable_command_help = help_strings['disable_command_help']
+stats_command_help = help_strings['stats_command_help']
 
 group_command_help = '\n'.join([
     add_command_help,
     del_command_help,
     list_command_help,
     enable_command_help,
-    disable_command_help
+    disable_command_help,
+    stats_command_help,
 ])
 
 bot_description = f"""\
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import re
+import string
+import weakref
+
+from .errors import InvalidTemplateError
+
+log = logging.getLogger(__name__)
+
+MAX_TEMPLATE_LENGTH = 1000
+
+ROLE_MENTION = re.compile(r'<@&(\d+)>')
+USER_MENTION = re.compile(r'<@!?\d+>')
+MASS_MENTION = re.compile(r'@(everyone|here)')
+
+
+class Template:
+    """A validated notification template.
+
+    Templates are ``str.format`` strings that can use the following fields:
+    ``{name}``, ``{service}``, ``{url}`` and ``{viewers}``.
+
+    They can't mention ``@everyone``, ``@here`` nor users, whoever saved them.
+    """
+
+    FIELDS = ('name', 'service', 'url', 'viewers')
+
+    def __init__(self, source: str):
+        if len(source) > MAX_TEMPLATE_LENGTH:
+            raise InvalidTemplateError(f'Templates can have at most {MAX_TEMPLATE_LENGTH} characters.')
+        try:
+            parsed = list(string.Formatter().parse(source))
+        except ValueError as e:
+            raise InvalidTemplateError(f'Invalid template: {e}')
+        for _, field, spec, conversion in parsed:
+            if field is None:
+                continue
+            if field not in self.FIELDS:
+                fields = ', '.join(f'{{{f}}}' for f in self.FIELDS)
+                raise InvalidTemplateError(f'Unknown field {{{field}}}. Valid fields are {fields}.')
+            if spec or conversion:
+                raise InvalidTemplateError(f'Field {{{field}}} cannot have a format spec nor a conversion.')
+        if MASS_MENTION.search(source):
+            raise InvalidTemplateError("Templates can't mention @everyone nor @here.")
+        if USER_MENTION.search(source):
+            raise InvalidTemplateError("Templates can't mention users.")
+        self.source = source
+
+    def render(self, streamer) -> str:
+        return self.source.format(
+            name=streamer.channel_name,
+            service=streamer.service_name.capitalize(),
+            url=streamer.stream_url,
+            viewers=streamer.channel_viewers,
+        )
+
+
+def validate_role_mentions(source: str, channel, author):
+    """Makes sure that the roles mentioned in a template belong to the channel's
+    guild, and that the author could mention them in that channel"""
+    can_mention_everyone = channel.permissions_for(author).mention_everyone
+    for role_id in ROLE_MENTION.findall(source):
+        role = channel.guild.get_role(int(role_id))
+        if role is None:
+            raise InvalidTemplateError("Templates can only mention this server's roles.")
+        if not role.mentionable and not can_mention_everyone:
+            raise InvalidTemplateError(f"The role {role.name} isn't mentionable.")
+
+
+class Templates:
+    """Cache of the compiled notification templates of every subscriber.
+
+    Subscribers with the same template share a single :class:`Template`, so
+    that it's rendered once per streamer no matter how many subscribers use it.
+    Compiled templates are only kept while a subscriber uses them.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._templates = None
+        self._compiled = weakref.WeakValueDictionary()
+        self._lock = asyncio.Lock()
+
+    def _compile(self, source: str) -> Template:
+        template = self._compiled.get(source)
+        if template is None:
+            template = self._compiled[source] = Template(source)
+        return template
+
+    async def _cache(self):
+        if self._templates is None:
+            async with self._lock:
+                if self._templates is None:
+                    templates = {}
+                    for (subscriber_id, source) in await self.bot.database.get_all_templates():
+                        try:
+                            templates[subscriber_id] = self._compile(source)
+                        except InvalidTemplateError as e:
+                            log.error('Invalid template for subscriber %s: %s', subscriber_id, e)
+                    self._templates = templates
+        return self._templates
+
+    async def get(self, subscriber_id: int):
+        return (await self._cache()).get(subscriber_id)
+
+    async def set(self, subscriber_id: int, source: str):
+        template = self._compile(source)
+        await self.bot.database.set_template(subscriber_id=subscriber_id, template=source)
+        (await self._cache())[subscriber_id] = template
+
+    async def remove(self, subscriber_id: int):
+        if (await self._cache()).pop(subscriber_id, None):
+            await self.bot.database.delete_template(subscriber_id=subscriber_id)
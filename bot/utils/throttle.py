@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+
+from .errors import CommandThrottledError
+
+
+class TokenBucket:
+    """Allows ``capacity`` operations in a burst, refilling ``rate`` tokens per second"""
+
+    def __init__(self, *, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self) -> float:
+        """Takes a token from the bucket.
+
+        :return: 0 if a token was taken, otherwise how many seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Throttle:
+    """Per-user and per-guild token buckets for commands.
+
+    Only the most recently used ``max_buckets`` buckets of each kind are kept,
+    since an evicted bucket would have refilled by then anyway.
+    """
+
+    def __init__(self, *, user=(5, 1 / 10), guild=(20, 1 / 3), max_buckets=10000):
+        self.user = user
+        self.guild = guild
+        self.max_buckets = max_buckets
+        self.user_buckets = OrderedDict()
+        self.guild_buckets = OrderedDict()
+
+    def _bucket(self, buckets, key, params):
+        try:
+            buckets.move_to_end(key)
+            return buckets[key]
+        except KeyError:
+            capacity, rate = params
+            bucket = buckets[key] = TokenBucket(capacity=capacity, rate=rate)
+            if len(buckets) > self.max_buckets:
+                buckets.popitem(last=False)
+            return bucket
+
+    def hit(self, ctx):
+        """Consumes a token for the command's author and guild.
+
+        :raises CommandThrottledError: If either bucket is empty
+        """
+        retry_after = self._bucket(self.user_buckets, ctx.author.id, self.user).consume()
+        if not retry_after and ctx.guild:
+            retry_after = self._bucket(self.guild_buckets, ctx.guild.id, self.guild).consume()
+        if retry_after:
+            raise CommandThrottledError(retry_after)
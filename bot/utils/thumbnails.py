@@ -0,0 +1,74 @@
+import random
+from collections import OrderedDict
+
+
+def anticache():
+    return f'{random.randint(0, 2 ** 64 - 1):016x}'
+
+
+class _Version:
+    __slots__ = ('session_id', 'version', 'uses')
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.version = session_id or anticache()
+        self.uses = 0
+
+
+class ThumbnailVersions:
+    """Size-bounded LRU of the thumbnail URL version of every live stream.
+
+    Every notification of a go-live uses the same versioned thumbnail URL, so
+    that Discord's media proxy fetches the image once per go-live instead of
+    once per notification. The version is the stream's session id, or a
+    random one that's kept until the stream ends when the service has none.
+
+    The first notification sent with a URL is counted as a miss, since the
+    media proxy has to fetch it, and the following ones as hits.
+    """
+
+    def __init__(self, *, max_size=10000):
+        self.max_size = max_size
+        self.versions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def version(self, key, session_id=None) -> str:
+        """Returns the thumbnail version of the stream's current session
+
+        :param key: (service, service_id)
+        """
+        entry = self.versions.get(key)
+        if entry is None or (session_id and entry.session_id != session_id):
+            entry = self.versions[key] = _Version(session_id)
+            if len(self.versions) > self.max_size:
+                self.versions.popitem(last=False)
+                self.evictions += 1
+        self.versions.move_to_end(key)
+        return entry.version
+
+    def forget(self, key):
+        """Forgets the version of a stream that ended"""
+        self.versions.pop(key, None)
+
+    def record_use(self, key, version: str):
+        """Counts a notification sent with the stream's thumbnail URL"""
+        entry = self.versions.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return
+        entry.uses += 1
+        if entry.uses > 1:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self) -> str:
+        return (f'{len(self.versions)}/{self.max_size} streams, {self.evictions} evicted\n'
+                f'{self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} of the notifications reused a URL)')
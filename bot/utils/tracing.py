@@ -0,0 +1,165 @@
+import bisect
+import collections
+import itertools
+import json
+import logging
+import pathlib
+import time
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Stages of a notification, in the order they happen
+STAGES = (
+    'detection',    # from the stream starting to the poll that saw it returning, if the service says when it started
+    'poll',         # from the poll starting to it returning
+    'lookup',       # fetching the streamer's subscribers from the database
+    'queueing',     # waiting in the notification batcher for the next delivery pass
+    'resolution',   # resolving the subscriber id into a user or a channel
+    'scheduling',   # waiting for the outbound scheduler
+    'send',         # sending the messages
+    'delivered',    # from the poll returning to the messages being sent
+    'end_to_end',   # from the stream starting to the messages being sent
+)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Returns the upper bound of the bucket holding the p-th percentile"""
+        rank = p / 100 * self.count
+        for bound, cumulative in zip(BUCKETS, itertools.accumulate(self.counts)):
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def __str__(self):
+        return (f'n={self.count} mean={self.mean:.3f}s p50<={self.percentile(50):.3f}s '
+                f'p95<={self.percentile(95):.3f}s max={self.max:.3f}s')
+
+
+class NotificationTrace:
+    """Timings of the notifications sent because a streamer went online"""
+
+    __slots__ = ('tracer', 'trace_id', 'service', 'channel_name', 'started_at', 'detected_at', 'queued_at')
+
+    def __init__(self, tracer, trace_id, service, channel_name, started_at, detected_at):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.service = service
+        self.channel_name = channel_name
+        self.started_at = started_at
+        self.detected_at = detected_at
+        self.queued_at = None
+
+    def span(self, stage: str, start: float, end: float, *, subscriber_id: int = None):
+        self.tracer.record(self, stage, start, end, subscriber_id)
+
+    def delivered(self, end: float, *, subscriber_id: int):
+        """Records the end to end spans of a notification that was sent"""
+        if self.detected_at is not None:
+            self.span('delivered', self.detected_at, end, subscriber_id=subscriber_id)
+        if self.started_at is not None:
+            self.span('end_to_end', self.started_at, end, subscriber_id=subscriber_id)
+
+
+class Tracer:
+    """Traces the latency of every notification, from the stream starting to
+    the message being sent.
+
+    Spans are aggregated into per service and per stage histograms, and the
+    latest ``max_spans`` spans are kept so that they can be exported in the
+    Chrome trace event format, which can be opened in ``chrome://tracing``
+    or https://ui.perfetto.dev. Times are wall clock times, since the start
+    of a stream comes from the streaming service.
+    """
+
+    def __init__(self, *, loop, path='traces/notifications.json', max_spans=50000):
+        self.loop = loop
+        self.path = pathlib.Path(path)
+        self.histograms = collections.defaultdict(lambda: collections.defaultdict(Histogram))
+        self.spans = collections.deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+
+    def start(self, service: str, streamer, *, polled_at=None, detected_at=None, catch_up=False):
+        """Starts tracing the notifications of a streamer that went online.
+
+        :param polled_at: When the poll that saw the streamer online started
+        :param detected_at: When that poll returned
+        :param catch_up: Whether the streamer was already online when the bot
+            started, in which case the stream's start isn't taken into account
+        """
+        started_at = None if catch_up else streamer.started_at
+        trace = NotificationTrace(self, next(self._ids), service, streamer.channel_name, started_at, detected_at)
+        if detected_at is not None:
+            if polled_at is not None:
+                trace.span('poll', polled_at, detected_at)
+            if started_at is not None:
+                trace.span('detection', started_at, detected_at)
+        return trace
+
+    def record(self, trace: NotificationTrace, stage: str, start: float, end: float, subscriber_id: int = None):
+        self.histograms[trace.service][stage].add(max(0.0, end - start))
+        self.spans.append((trace.service, trace.trace_id, trace.channel_name, stage, start, end, subscriber_id))
+
+    def summary(self):
+        lines = []
+        for service, histograms in sorted(self.histograms.items()):
+            lines.append(f'{service}:')
+            for stage in STAGES:
+                if stage in histograms:
+                    lines.append(f'  {stage:<10} {histograms[stage]}')
+        return '\n'.join(lines) or 'No notifications traced yet.'
+
+    def _events(self, spans):
+        pids = {}
+        events = []
+        for service, trace_id, channel_name, stage, start, end, subscriber_id in spans:
+            pid = pids.get(service)
+            if pid is None:
+                pid = pids[service] = len(pids) + 1
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': service}})
+            # async events, since the deliveries of a trace overlap
+            event_id = f'{trace_id}.{subscriber_id}' if subscriber_id else str(trace_id)
+            args = {'streamer': channel_name, 'subscriber_id': subscriber_id}
+            common = {'name': stage, 'cat': service, 'id': event_id, 'pid': pid, 'tid': trace_id}
+            events.append(dict(common, ph='b', ts=start * 1e6, args=args))
+            events.append(dict(common, ph='e', ts=end * 1e6))
+        return events
+
+    def _write(self, spans, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        with temporary.open('w') as f:
+            json.dump({'traceEvents': self._events(spans), 'displayTimeUnit': 'ms'}, f)
+        temporary.replace(path)
+
+    async def export(self, path=None):
+        """Writes the kept spans into a trace file without blocking the event loop
+
+        :return: The path of the trace file
+        """
+        path = pathlib.Path(path) if path else self.path
+        started = time.perf_counter()
+        await self.loop.run_in_executor(None, self._write, list(self.spans), path)
+        log.info('Exported %s spans to %s in %.3fs', len(self.spans), path, time.perf_counter() - started)
+        return path
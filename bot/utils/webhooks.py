@@ -0,0 +1,95 @@
+import asyncio
+import logging
+
+import discord
+
+from . import outbound
+
+log = logging.getLogger(__name__)
+
+# Discord allows at most this many embeds in a single webhook message
+MAX_EMBEDS_PER_MESSAGE = 10
+
+
+def message_count(embed_count: int) -> int:
+    """Returns the number of webhook messages needed to send that many embeds"""
+    return -(-embed_count // MAX_EMBEDS_PER_MESSAGE)
+
+
+class Webhooks:
+    """Cache of the webhooks used to deliver notifications to text channels.
+
+    Webhook messages have their own rate limit buckets and can carry several
+    embeds at once, which makes them much cheaper than regular bot messages
+    for channels subscribed to many streamers.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.adapter = discord.AsyncWebhookAdapter(bot.session)
+        self._webhooks = None
+        self._lock = asyncio.Lock()
+
+    async def _cache(self):
+        if self._webhooks is None:
+            async with self._lock:
+                if self._webhooks is None:
+                    self._webhooks = {
+                        channel_id: discord.Webhook.partial(webhook_id, webhook_token, adapter=self.adapter)
+                        for (channel_id, webhook_id, webhook_token) in await self.bot.database.get_all_webhooks()
+                    }
+        return self._webhooks
+
+    async def get(self, channel_id: int):
+        return (await self._cache()).get(channel_id)
+
+    async def create(self, channel: discord.TextChannel):
+        """Creates a webhook in the channel and starts delivering notifications through it"""
+        await self.remove(channel.id)
+        webhook = await channel.create_webhook(name=self.bot.user.name)
+        await self.bot.database.add_webhook(channel_id=channel.id, webhook_id=webhook.id, webhook_token=webhook.token)
+        (await self._cache())[channel.id] = discord.Webhook.partial(webhook.id, webhook.token, adapter=self.adapter)
+        log.info('Created webhook %s for channel %s (%s)', webhook.id, channel, channel.id)
+
+    async def remove(self, channel_id: int):
+        """Stops delivering notifications to the channel through a webhook.
+
+        The webhook itself is deleted on a best effort basis.
+        """
+        webhook = (await self._cache()).pop(channel_id, None)
+        if not webhook:
+            return
+        await self.bot.database.delete_webhook(channel_id=channel_id)
+        try:
+            await self.bot.outbound.acquire(outbound.MAINTENANCE)
+            await webhook.delete()
+        except discord.HTTPException:
+            pass
+        log.info('Removed webhook %s for channel %s', webhook.id, channel_id)
+
+    async def send(self, channel_id: int, embeds, content=None):
+        """Sends the embeds through the channel's webhook, along with the
+        content in the first message.
+
+        :return: The embeds that couldn't be delivered, because the channel
+            has no webhook or because it has been deleted. These should be sent
+            as regular messages instead.
+        """
+        webhook = await self.get(channel_id)
+        if not webhook:
+            return embeds
+
+        for i in range(0, len(embeds), MAX_EMBEDS_PER_MESSAGE):
+            try:
+                await webhook.send(
+                    content=content if i == 0 else None,
+                    embeds=embeds[i:i + MAX_EMBEDS_PER_MESSAGE],
+                    username=self.bot.user.name,
+                    avatar_url=self.bot.user.avatar_url,
+                )
+            except discord.NotFound:
+                log.warning('Webhook %s for channel %s is gone, falling back to messages', webhook.id, channel_id)
+                await self.remove(channel_id)
+                return embeds[i:]
+
+        return []
@@ -0,0 +1,38 @@
+"""Runs a notification delivery worker.
+
+Usage::
+
+    SNB_DELIVERY_WORKERS=count TOKEN_DISCORD=token python3.6 -m bot.worker
+
+The worker delivers the notifications that the bot queues when it's started
+with ``SNB_DELIVERY_WORKERS=count``. That many workers can run at once, and
+they split the global rate limit with the bot.
+"""
+
+import asyncio
+import os
+
+from . import create_database, log, setup_event_loop, shutdown_logging
+from .utils.delivery import DeliveryWorker
+
+
+def main():
+    if setup_event_loop():
+        log.info('Using uvloop event loop')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    database = loop.run_until_complete(create_database(loop))
+
+    worker = DeliveryWorker(database, loop=loop, workers=int(os.environ.get('SNB_DELIVERY_WORKERS', 1)))
+    try:
+        loop.run_until_complete(worker.run(os.environ['TOKEN_DISCORD']))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(worker.close())
+        loop.run_until_complete(database.close())
+        shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
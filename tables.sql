@@ -12,6 +12,52 @@ CREATE TABLE IF NOT EXISTS subscriptions (
   PRIMARY KEY (subscriber_id, streamer_id)
 );
 
+CREATE TABLE IF NOT EXISTS webhooks (
+  channel_id    BIGINT PRIMARY KEY,
+  webhook_id    BIGINT NOT NULL,
+  webhook_token TEXT   NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stream_sessions (
+  service         TEXT      NOT NULL,
+  service_id      TEXT      NOT NULL,
+  started_at      TIMESTAMP NOT NULL,
+  ended_at        TIMESTAMP NOT NULL,
+  peak_viewers    INTEGER   NOT NULL,
+  average_viewers INTEGER   NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS stream_sessions_streamer_idx ON stream_sessions (service, service_id);
+
+CREATE TABLE IF NOT EXISTS stream_daily_stats (
+  service          TEXT    NOT NULL,
+  service_id       TEXT    NOT NULL,
+  day              DATE    NOT NULL,
+  sessions         INTEGER NOT NULL,
+  duration_seconds BIGINT  NOT NULL,
+  viewer_seconds   BIGINT  NOT NULL,
+  peak_viewers     INTEGER NOT NULL,
+  PRIMARY KEY (service, service_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS notification_templates (
+  subscriber_id BIGINT PRIMARY KEY,
+  template      TEXT   NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS notification_queue (
+  notification_id BIGSERIAL PRIMARY KEY,
+  subscriber_id   BIGINT    NOT NULL,
+  key             TEXT      NOT NULL,
+  payload         TEXT      NOT NULL,
+  queued_at       TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE TABLE IF NOT EXISTS delivery_channels (
+  subscriber_id BIGINT PRIMARY KEY,
+  channel_id    BIGINT NOT NULL
+);
+
 CREATE OR REPLACE FUNCTION delete_empty() RETURNS trigger AS
 $$
 BEGIN
@@ -0,0 +1,73 @@
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS streamers (
+  streamer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  service_id  TEXT    NOT NULL,
+  service     TEXT    NOT NULL,
+  username    TEXT    NOT NULL,
+  UNIQUE (service, username)
+);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+  subscriber_id BIGINT  NOT NULL,
+  streamer_id   INTEGER NOT NULL REFERENCES streamers (streamer_id) ON DELETE CASCADE,
+  PRIMARY KEY (subscriber_id, streamer_id)
+);
+
+CREATE TABLE IF NOT EXISTS webhooks (
+  channel_id    BIGINT PRIMARY KEY,
+  webhook_id    BIGINT NOT NULL,
+  webhook_token TEXT   NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stream_sessions (
+  service         TEXT      NOT NULL,
+  service_id      TEXT      NOT NULL,
+  started_at      TIMESTAMP NOT NULL,
+  ended_at        TIMESTAMP NOT NULL,
+  peak_viewers    INTEGER   NOT NULL,
+  average_viewers INTEGER   NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS stream_sessions_streamer_idx ON stream_sessions (service, service_id);
+
+CREATE TABLE IF NOT EXISTS stream_daily_stats (
+  service          TEXT    NOT NULL,
+  service_id       TEXT    NOT NULL,
+  day              DATE    NOT NULL,
+  sessions         INTEGER NOT NULL,
+  duration_seconds BIGINT  NOT NULL,
+  viewer_seconds   BIGINT  NOT NULL,
+  peak_viewers     INTEGER NOT NULL,
+  PRIMARY KEY (service, service_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS notification_templates (
+  subscriber_id BIGINT PRIMARY KEY,
+  template      TEXT   NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS notification_queue (
+  notification_id INTEGER   PRIMARY KEY AUTOINCREMENT,
+  subscriber_id   BIGINT    NOT NULL,
+  key             TEXT      NOT NULL,
+  payload         TEXT      NOT NULL,
+  queued_at       TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS delivery_channels (
+  subscriber_id BIGINT PRIMARY KEY,
+  channel_id    BIGINT NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS empty_streamers
+  AFTER DELETE
+  ON subscriptions
+  FOR EACH ROW
+  WHEN NOT EXISTS (SELECT 1 FROM subscriptions WHERE streamer_id = OLD.streamer_id)
+BEGIN
+  DELETE FROM streamers
+  WHERE streamers.streamer_id = OLD.streamer_id;
+END;
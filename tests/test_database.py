@@ -0,0 +1,163 @@
+"""Contract tests that every storage backend has to pass.
+
+The SQLite backend is tested against an in-memory database. The Postgres
+backend is tested too if ``SNB_TEST_DB_HOST`` points to a server with a
+throwaway ``snb_test`` database owned by ``snb_role``, since its tables are
+emptied by every test.
+"""
+
+import asyncio
+import datetime
+import os
+import pathlib
+
+import pytest
+
+pytest.importorskip('discord')
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope='module', autouse=True)
+def workdir(tmp_path_factory):
+    """Runs the tests from a directory with the bot and the files that it loads,
+    so that the log files don't end up in the repository"""
+    path = tmp_path_factory.mktemp('snb')
+    (path / 'logs').mkdir()
+    for name in ('bot', 'strings.toml', 'tables.sql', 'tables_sqlite.sql'):
+        (path / name).symlink_to(ROOT / name)
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+
+
+async def create_sqlite(loop):
+    pytest.importorskip('aiosqlite')
+    from bot.utils.sqlite import SQLiteDatabase
+    return await SQLiteDatabase.create_database(loop=loop, path=':memory:')
+
+
+async def create_postgres(loop):
+    hostname = os.environ.get('SNB_TEST_DB_HOST')
+    if not hostname:
+        pytest.skip('SNB_TEST_DB_HOST is not set')
+    from bot.utils.database import PostgresDatabase
+    database = await PostgresDatabase.create_database(
+        loop=loop,
+        username='snb_role',
+        password='snb_role',
+        database='snb_test',
+        hostname=hostname,
+        port=int(os.environ.get('SNB_TEST_DB_PORT', 5432)),
+    )
+    await database.pool.execute(
+        'TRUNCATE streamers, subscriptions, stream_sessions, stream_daily_stats, notification_queue CASCADE')
+    return database
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    create = create_sqlite if request.param == 'sqlite' else create_postgres
+    try:
+        database = loop.run_until_complete(create(loop))
+    except BaseException:
+        loop.close()
+        raise
+    yield database, loop.run_until_complete
+    loop.run_until_complete(database.close())
+    loop.close()
+
+
+def subscribe(run, database, subscriber_id, username, service='twitch'):
+    run(database.add_subscription(
+        subscriber_id=subscriber_id,
+        service=service,
+        username=username,
+        service_id=f'{username}_id',
+    ))
+
+
+def test_add_subscription(backend):
+    database, run = backend
+    subscribe(run, database, 1, 'foo')
+    subscribe(run, database, 2, 'foo')
+    subscribe(run, database, 1, 'bar', service='picarto')
+
+    assert [r['username'] for r in run(database.get_subscriptions_from_subscriber(1, 'twitch'))] == ['foo']
+    (streamer,) = run(database.get_all_streamers_from_service(service='twitch'))
+    assert streamer['username'] == 'foo'
+    assert streamer['service_id'] == 'foo_id'
+    subscribers = run(database.get_subscribers_from_streamer(streamer['streamer_id']))
+    assert sorted(subscriber_id for (subscriber_id,) in subscribers) == [1, 2]
+
+
+def test_duplicate_subscription(backend):
+    from bot.utils.errors import StreamerAlreadyExists
+    database, run = backend
+    subscribe(run, database, 1, 'foo')
+    with pytest.raises(StreamerAlreadyExists):
+        subscribe(run, database, 1, 'foo')
+    assert len(run(database.get_subscriptions_from_subscriber(1, 'twitch'))) == 1
+
+
+def test_del_subscription(backend):
+    database, run = backend
+    subscribe(run, database, 1, 'foo')
+    subscribe(run, database, 2, 'foo')
+
+    run(database.del_subscription(subscriber_id=1, service='twitch', username='foo'))
+    assert not run(database.get_subscriptions_from_subscriber(1, 'twitch'))
+    assert len(run(database.get_all_streamers_from_service(service='twitch'))) == 1
+
+    # streamers without subscribers are deleted
+    run(database.del_subscription(subscriber_id=2, service='twitch', username='foo'))
+    assert not run(database.get_all_streamers_from_service(service='twitch'))
+
+
+def test_delete_subscriber(backend):
+    database, run = backend
+    subscribe(run, database, 1, 'foo')
+    subscribe(run, database, 1, 'bar')
+    subscribe(run, database, 2, 'bar')
+
+    run(database.delete_subscriber(subscriber_id=1))
+    assert not run(database.get_subscriptions_from_subscriber(1, 'twitch'))
+    assert [r['username'] for r in run(database.get_all_streamers_from_service(service='twitch'))] == ['bar']
+
+
+def test_stream_stats(backend):
+    database, run = backend
+    assert run(database.get_stream_stats(service='twitch', username='foo')) is None
+
+    subscribe(run, database, 1, 'foo')
+    stats = run(database.get_stream_stats(service='twitch', username='foo'))
+    assert stats['sessions'] == 0
+
+    day = datetime.datetime(2018, 1, 1, 10)
+    run(database.add_stream_sessions([
+        ('twitch', 'foo_id', day, day + datetime.timedelta(hours=1), 20, 10),
+        ('twitch', 'foo_id', day + datetime.timedelta(days=1), day + datetime.timedelta(days=1, hours=2), 50, 30),
+    ]))
+    expected = (2, 3 * 3600, 3600 * 10 + 2 * 3600 * 30, 50)
+    stats = run(database.get_stream_stats(service='twitch', username='foo'))
+    assert tuple(stats) == expected
+
+    # rolled up sessions still count
+    run(database.rollup_stream_sessions(before=day + datetime.timedelta(days=1)))
+    stats = run(database.get_stream_stats(service='twitch', username='foo'))
+    assert tuple(stats) == expected
+
+
+def test_notification_queue(backend):
+    database, run = backend
+    run(database.enqueue_notifications([(1, 'foo_id', 'a'), (2, 'foo_id', 'b'), (3, 'bar_id', 'c')]))
+
+    # the oldest notifications are claimed first, in no particular order
+    claimed = run(database.claim_notifications(limit=2))
+    assert sorted(tuple(r) for r in claimed) == [(1, 'foo_id', 'a'), (2, 'foo_id', 'b')]
+    claimed = run(database.claim_notifications(limit=2))
+    assert sorted(tuple(r) for r in claimed) == [(3, 'bar_id', 'c')]
+    assert not run(database.claim_notifications(limit=2))